@@ -1,5 +1,5 @@
 #!/usr/bin/python3 -OOB
-""" deflatebench.py -- A util that benchmarks minigzip/minideflate.
+""" deflatebench.py -- A util that benchmarks minigzip/minideflate, and other compressors through tool adapters.
 
     Copyright (C) Hans Kristian Rosbach
 
@@ -9,18 +9,44 @@
 
 import os, os.path
 import sys
+import math
 import time
-import shutil
+import random
 import argparse
 import statistics
-
+import threading
+import shutil
+import tempfile
+import signal
+import hashlib
+import mmap
+import queue
+import concurrent.futures
+
+from includes import adapters
+from includes import cache
+from includes import checkpoint
 from includes import cli
 from includes import config
+from includes import corpus
+from includes import engine
+from includes import gitbisect
+from includes import hashindex
+from includes import matrix
+from includes import profile
+from includes import resultsdb
+from includes import staging
+from includes import stats
+from includes import synth
 from includes import util
 
 # Simple usleep function
 usleep = lambda x: time.sleep(x/1000000.0)
 
+# Testfiles preloaded into memory for the ctypes engine
+inputbufs = dict()
+inputlock = threading.Lock()
+
 def command_prefix(filen):
     ''' Build the benchmarking command prefix '''
     if cfgTuning['use_chrt']:
@@ -28,82 +54,328 @@ def command_prefix(filen):
     else:
         command = "/usr/bin/nice -n -20"
 
-    if cfgConfig['use_perf']:
-        command += f" /usr/bin/perf stat -D {cfgConfig['start_delay']} -e cpu-clock:u -o '{filen}' -- "
+    # perf output is parsed, keep its numbers free of locale dependent grouping and decimal separators
+    if cfgConfig['use_perf'] and cfgConfig['perf_events']:
+        command += f" /usr/bin/env LC_ALL=C /usr/bin/perf stat --no-big-num --no-scale -D {cfgConfig['start_delay']} -e cpu-clock:u,{cfgConfig['perf_events']} -o '{filen}' -- "
+    elif cfgConfig['use_perf']:
+        command += f" /usr/bin/env LC_ALL=C /usr/bin/perf stat --no-big-num -D {cfgConfig['start_delay']} -e cpu-clock:u -o '{filen}' -- "
     else:
         timeformat="%U"
-        command += f" -20 /usr/bin/time -o {timefile} -f '{timeformat}' -- "
+        command += f" -20 /usr/bin/time -o {filen} -f '{timeformat}' -- "
 
     return command
 
-def runtest(tempfiles,level):
+def measurement(timefile,starttime):
+    ''' Return cputime of the last command, and its perf counters if configured.
+        The time is always user seconds, counters are only recorded alongside it '''
+    if sys.platform == 'win32':
+        return time.perf_counter() - starttime, dict()
+    if not cfgConfig['use_perf'] or not cfgConfig['perf_events']:
+        return util.parse_timefile(timefile), dict()
+    return util.parse_timefile(timefile), util.parse_perfstat(timefile)
+
+def timedcommand(cmdprefix,command,timefile,env=None,cpu=None,output=os.devnull,hashoutput=False):
+    ''' Run benchmarked command, returns its cputime, measurement details and hash of its output if requested '''
+    sha1 = hashlib.sha1() if hashoutput else None
+    stream = sha1.update if hashoutput else None
+
+    if cfgConfig['use_rusage'] and sys.platform != 'win32':
+        usage = util.runmeasured(command, env=env, output=output, cpu=cpu, stream=stream, realtime=cfgTuning['use_chrt'])
+        cputime, details = usage['user'], usage
+    else:
+        starttime = time.perf_counter()
+        util.runcommand(f"{cmdprefix} {command}", env=env, output=output, cpu=cpu, stream=stream)
+        cputime, details = measurement(timefile,starttime)
+
+    return cputime, details, sha1.hexdigest() if sha1 else None
+
+def compcommand(level,filename,tool=None):
+    ''' Return testtool command compressing filename to stdout, with the parameters of a matrix level key '''
+    tool = tool if tool else cfgRuns['testtool']
+    level, params = matrix.split(level)
+    return adapters.compcommand(tool, level, filename, matrix.args(params, streamformat(tool)))
+
+def decompcommand(filename,tool=None,fmt=None,level=None):
+    ''' Return testtool command decompressing filename to stdout, fmt selects another stream format than the tool's own '''
+    params = matrix.split(level)[1] if level else {}
+    return adapters.decompcommand(tool if tool else cfgRuns['testtool'], filename, engine.WBITS[fmt if fmt else streamformat(tool)],
+                                  matrix.args(params, streamformat(tool), decompress=True))
+
+def runfile(name):
+    ''' Return path of a tempfile of this invocation, in its own directory under temp_path '''
+    # Instances sharing temp_path neither overwrite nor clean up each other's files
+    return os.path.join(rundir, name)
+
+rundir = None
+
+def jobfiles(suffix=''):
+    ''' Build dict of tempfile names used by one benchmark job '''
+    files = dict()
+    files['timefile'] = runfile(f"zlib-time{suffix}.tmp")
+    files['compfile'] = runfile(f"zlib-testfil{suffix}.gz")
+    return files
+
+def streamformat(tool=None):
+    ''' Return format of the compressed stream produced by the tool being benchmarked '''
+    if cfgConfig['engine'] == 'ctypes':
+        return cfgConfig['engine_format']
+    return adapters.find(tool if tool else cfgRuns['testtool'])['format']
+
+def verify_zlib(chunks,orighash,level,tool=None,fmt=None):
+    ''' Verify compressed stream and its trailer using python zlib, returns 1 on failure '''
+    zlibhash, _, error = util.verifystream(chunks, engine.WBITS[fmt if fmt else streamformat(tool)])
+    if error:
+        print(f"Level {level}: {error}")
+        return 1
+    if zlibhash != orighash:
+        print(f"{orighash} != {zlibhash}")
+        return 1
+    return 0
+
+def runtest(tempfiles,level,verify,files=None,cpu=None,quiet=False,tool=None):
     ''' Run benchmark and tests for current compression level'''
     hashfail, decomptime = 0,0
+    extra = {'comp': dict(), 'decomp': dict()}
     testfile = tempfiles[level]['filename']
     orighash = tempfiles[level]['hash']
+    artifact = tempfiles[level].get('artifact')
     cmdprefix = ''
+    files = files if files else jobfiles()
+    timefile, compfile = files['timefile'], files['compfile']
+    progress = (lambda text: None) if quiet else cli.printnn
 
     env = util.get_env(True)
 
-    sys.stdout.write(f"Testing level {level}: ")
+    if not quiet:
+        sys.stdout.write(f"Testing level {level}: ")
     if sys.platform != 'win32':
-        cmdprefix = command_prefix(timefile)
-        util.runcommand('sync')
-
-    # Compress
-    cli.printnn('c')
-    usleep(10)
-    starttime = time.perf_counter()
-    testtool = os.path.realpath(cfgRuns['testtool'])
-
-    util.runcommand(f"{cmdprefix} {testtool} -{level} -c {testfile}", env=env, output=compfile)
-    if sys.platform != 'win32':
-        comptime = util.parse_timefile(timefile)
+        if not cfgConfig['use_rusage']:
+            cmdprefix = command_prefix(timefile)
+        # A sync per job would add I/O to the measurements running on the other cpus in parallel mode
+        if cpu is None:
+            util.runcommand('sync')
+
+    # Compress, unless decompressing an artifact that was compressed once before the runs
+    if artifact:
+        compfile, compsize, comptime = artifact['filename'], artifact['size'], 0
     else:
-        comptime = time.perf_counter() - starttime
-    compsize = os.path.getsize(compfile)
+        progress('c')
+        usleep(10)
+        comptime, extra['comp'], _ = timedcommand(cmdprefix, compcommand(level, testfile, tool), timefile, env=env, cpu=cpu, output=compfile)
+        compsize = os.path.getsize(compfile)
+        staging.prepare(compfile)
 
     # Decompress
-    if not cfgConfig['skipdecomp'] or not cfgConfig['skipverify']:
-        cli.printnn('d')
+    if not cfgConfig['skipdecomp'] or verify:
+        progress('d')
         usleep(10)
-        starttime = time.perf_counter()
-        util.runcommand(f"{cmdprefix} {testtool} -d -c {compfile}", env=env, output=decompfile)
+        # Hash output straight from the pipe when verifying, instead of going through a tempfile
+        decomptime, extra['decomp'], ourhash = timedcommand(cmdprefix, decompcommand(compfile, tool, artifact['format'] if artifact else None, level), timefile,
+                                                            env=env, cpu=cpu, hashoutput=verify)
 
-        if sys.platform != 'win32':
-            decomptime = util.parse_timefile(timefile)
-        else:
-            decomptime = time.perf_counter() - starttime
-
-        if not cfgConfig['skipverify']:
-            ourhash = util.hashfile(decompfile)
-            if ourhash != orighash:
-                print(f"{orighash} != {ourhash}")
-                hashfail = 1
-
-        os.unlink(decompfile)
-
-    # Validate using gunzip
-    if not cfgConfig['skipverify']:
-        cli.printnn('v')
-        util.runcommand(f"gunzip -c {compfile}", output=decompfile)
-
-        gziphash = util.hashfile(decompfile)
-        if gziphash != orighash:
-            print(f"{orighash} != {gziphash}")
+        if verify and ourhash != orighash:
+            print(f"{orighash} != {ourhash}")
             hashfail = 1
 
-        os.unlink(decompfile)
+    # Validate using python zlib
+    if verify and adapters.find(tool if tool else cfgRuns['testtool'])['verify'] == 'zlib':
+        progress('v')
+        hashfail |= verify_zlib(util.filechunks(compfile), orighash, level, tool, artifact['format'] if artifact else None)
 
     if os.path.exists(timefile):
         os.unlink(timefile)
-    os.unlink(compfile)
+    if not artifact:
+        os.unlink(compfile)
 
     comppct = float(compsize*100)/tempfiles[level]['origsize']
-    cli.printnn(f" {comptime:7.4f} {decomptime:7.4f} {compsize:15,} {comppct:7.3f}%")
-    cli.printnn('\n')
+    progress(f" {comptimestr(comptime)} {decomptime:7.4f} {compsize:15,} {comppct:7.3f}%")
+    progress('\n')
+
+    return compsize,comptime,decomptime,hashfail,extra
+
+def comptimestr(comptime):
+    ''' Format compression time of a job for progress output, it is not measured in decomp-only mode '''
+    return f"{'-':>7}" if cfgConfig['decomp_only'] else f"{comptime:7.4f}"
+
+def engine_input(filename):
+    ''' Load testfile into memory once, it is then shared by all jobs using it '''
+    with inputlock:
+        if filename not in inputbufs:
+            buf = engine.buffer(os.path.getsize(filename), cfgConfig['staging_hugepages'])
+            with open(filename, 'rb') as f:
+                f.readinto(buf)
+            inputbufs[filename] = buf
+    return inputbufs[filename]
+
+def runtest_engine(tempfiles,level,verify,files=None,cpu=None,quiet=False,tool=None):
+    ''' Run benchmark and tests for current compression level using the in-process ctypes engine '''
+    hashfail, decomptime = 0,0
+    origsize = tempfiles[level]['origsize']
+    orighash = tempfiles[level]['hash']
+    loops = cfgConfig['engine_loops']
+    wbits = engine.WBITS[streamformat()]
+    progress = (lambda text: None) if quiet else cli.printnn
+
+    if not quiet:
+        sys.stdout.write(f"Testing level {level}: ")
+    if cpu is not None:
+        os.sched_setaffinity(threading.get_native_id(), {cpu})
+
+    # Compress, unless decompressing an artifact that was compressed once before the runs
+    comptime = 0
+    artifact = tempfiles[level].get('artifact')
+    if artifact:
+        compbuf, compsize = engine_input(artifact['filename']), artifact['size']
+        wbits = engine.WBITS[artifact['format']]
+    else:
+        srcbuf = engine_input(tempfiles[level]['filename'])
+        compbuf = engine.buffer(engine.bound(origsize), cfgConfig['staging_hugepages'])
+        complevel, strategy = engine.parselevel(level)
+
+        progress('c')
+        for loop in range(loops):
+            compsize, cputime = engine.deflate(engine.address(srcbuf), origsize, engine.address(compbuf), len(compbuf),
+                                               complevel, strategy, wbits)
+            comptime += cputime
+        comptime /= loops
+
+    # Decompress
+    if not cfgConfig['skipdecomp'] or verify:
+        progress('d')
+        decompbuf = engine.buffer(origsize, cfgConfig['staging_hugepages'])
+        for loop in range(loops):
+            decompsize, cputime = engine.inflate(engine.address(compbuf), compsize, engine.address(decompbuf), origsize, wbits)
+            decomptime += cputime
+        decomptime /= loops
+
+        if verify:
+            ourhash = util.hashbuffer(memoryview(decompbuf)[:decompsize])
+            if decompsize != origsize or ourhash != orighash:
+                print(f"{orighash} != {ourhash}")
+                hashfail = 1
+        del decompbuf
+
+    # Validate using python zlib
+    if verify:
+        progress('v')
+        hashfail |= verify_zlib(util.bufferchunks(memoryview(compbuf)[:compsize]), orighash, level, fmt=artifact['format'] if artifact else None)
+
+    comppct = float(compsize*100)/origsize
+    progress(f" {comptimestr(comptime)} {decomptime:7.4f} {compsize:15,} {comppct:7.3f}%")
+    progress('\n')
+
+    return compsize,comptime,decomptime,hashfail,{'comp': dict(), 'decomp': dict()}
+
+def toollabel(results,tool):
+    ''' Return short label of tool when comparing several tools, A for the first one, B for the second '''
+    if len(results) < 2:
+        return ''
+    return chr(ord('A') + list(results).index(tool))
+
+def runjob(tempfiles,job,index,cpus=None):
+    ''' Run a single (run, level, tool) job, pinned to a free cpu if a cpu pool is given '''
+    run, level, tool = job
+    verify = run == 1 and not cfgConfig['skipverify'] and (cfgConfig['engine'] == 'ctypes' or adapters.find(tool)['verify'] != 'none')
+    benchtest = runtest_engine if cfgConfig['engine'] == 'ctypes' else runtest
+    staging.prepare(tempfiles[level]['artifact']['filename'] if cfgConfig['decomp_only'] else tempfiles[level]['filename'])
+    cpu = cpus.get() if cpus is not None else None
+    try:
+        # Record when and in which cpu state each sample was taken, for the drift check
+        cpustate = util.cpustate([cpu] if cpu is not None else None)
+        starttime = time.time()
+        if cpu is None:
+            result = benchtest(tempfiles,level,verify,tool=tool)
+        else:
+            result = benchtest(tempfiles,level,verify,files=jobfiles(f"-{index}"),cpu=cpu,quiet=True,tool=tool)
+    finally:
+        if cpu is not None:
+            cpus.put(cpu)
+    result[4]['timestamp'] = starttime
+    result[4]['cpustate'] = cpustate
+    return result
+
+def runjobs(tempfiles,jobs,results):
+    ''' Run list of (run, level, tool) jobs, serially or spread over the configured cpus, and merge into results[tool][level].
+        Jobs finished before resuming a checkpoint are not run again '''
+    cpulist = util.parse_cpulist(cfgConfig['parallel_cpus'])
+
+    if not cpulist:
+        lastrun = None
+        for index, job in enumerate(jobs):
+            run, level, tool = job
+            sample = checkpoint.lookup(job)
+            if sample is None:
+                if run != lastrun:
+                    # Between runs no job is measured, sync the samples of the previous run
+                    checkpoint.sync()
+                    print(f"Starting run {run} of {cfgRuns['maxruns'] if cfgRuns['adaptive'] else cfgRuns['runs']}")
+                    lastrun = run
+                cli.printnn(f"{toollabel(results,tool):2}" if len(results) > 1 else '')
+                compsize,comptime,decomptime,hashfail,extra = runjob(tempfiles,job,index)
+                if hashfail != 0:
+                    print(f"ERROR: level {level} failed crc checking")
+                sample = [compsize,comptime,decomptime,extra]
+                checkpoint.append(job, sample)
+            results[tool][level].append(sample)
+        checkpoint.sync()
+        return results
 
-    return compsize,comptime,decomptime,hashfail
+    samples = [checkpoint.lookup(job) for job in jobs]
+    print(f"Running {samples.count(None)} jobs in parallel on cpus {','.join(map(str, cpulist))}")
+    cpus = queue.Queue()
+    for cpu in cpulist:
+        cpus.put(cpu)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(cpulist)) as executor:
+        futures = {executor.submit(runjob, tempfiles, job, index, cpus): index for index, job in enumerate(jobs) if samples[index] is None}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                run, level, tool = jobs[index]
+                compsize,comptime,decomptime,hashfail,extra = future.result()
+                if hashfail != 0:
+                    print(f"ERROR: level {level} failed crc checking")
+                samples[index] = [compsize,comptime,decomptime,extra]
+                checkpoint.append(jobs[index], samples[index])
+                comppct = float(compsize*100)/tempfiles[level]['origsize']
+                label = f" {toollabel(results,tool)}" if len(results) > 1 else ''
+                print(f"Run {run:3} level {level:5}{label}: {comptimestr(comptime)} {decomptime:7.4f} {compsize:15,} {comppct:7.3f}%")
+        except BaseException:
+            # Let running jobs finish, but do not start any more when interrupted
+            executor.shutdown(cancel_futures=True)
+            raise
+    # Synced once all jobs are done, as parallel jobs are always being measured
+    checkpoint.sync()
+
+    # Merge in job order, so results[tool][level] keeps the same run order as a serial benchmark
+    for job, sample in zip(jobs, samples):
+        run, level, tool = job
+        results[tool][level].append(sample)
+    return results
+
+def converged(samples):
+    ''' Check if the confidence intervals of a level's times are narrow enough '''
+    comptimes = [sample[1] for sample in samples]
+    decomptimes = [sample[2] for sample in samples]
+    if stats.ci_relwidth(comptimes, cfgRuns['confidence']) > cfgRuns['ci_width']:
+        return False
+    if not cfgConfig['skipdecomp'] and stats.ci_relwidth(decomptimes, cfgRuns['confidence']) > cfgRuns['ci_width']:
+        return False
+    return True
+
+def runadaptive(tempfiles,results):
+    ''' Keep running levels until their results are stable enough, or maxruns is reached '''
+    active = list(map(str, getlevels()))
+    run = 0
+    while active and run < cfgRuns['maxruns']:
+        run += 1
+        runjobs(tempfiles,[(run, level, cfgRuns['testtool']) for level in levelorder(run, active)],results)
+        if run >= cfgRuns['minruns']:
+            active = [level for level in active if not converged(results[cfgRuns['testtool']][level])]
+
+    if active:
+        print(f"Warning: level(s) {', '.join(active)} did not converge within {cfgRuns['maxruns']} runs")
+    return results
 
 def trimworst(results):
     ''' Trim X worst results '''
@@ -112,22 +384,94 @@ def trimworst(results):
         return results
     return results[:-cfgRuns['trimworst']]
 
-def getlevels():
+def trimruns(runs,index):
+    ''' Trim X worst runs, ranked by the time at index like trimworst '''
+    runs = sorted(runs, key=lambda run: run[index])
+    if not cfgRuns['trimworst']:
+        return runs
+    return runs[:-cfgRuns['trimworst']]
+
+def levelorder(run,levels):
+    ''' Return the order to run levels in during a run: sequential, randomized, or rotated Latin square '''
+    if cfgRuns['order'] == 'random':
+        return random.Random(f"{cfgRuns['seed']}:{run}").sample(levels, len(levels))
+    if cfgRuns['order'] == 'latin':
+        # Rotating one shuffled order puts every level in every position once per len(levels) runs
+        base = random.Random(cfgRuns['seed']).sample(levels, len(levels))
+        shift = (run - 1) % len(levels)
+        return base[shift:] + base[:shift]
+    return levels
+
+def driftsamples(results,phase):
+    ''' Return (timestamp, cpu MHz, time relative to its level mean) of each sample having a timestamp '''
+    points = []
+    for samples in results.values():
+        samples = [sample for sample in samples if sample[3] and sample[3].get('timestamp')]
+        mean = statistics.fmean(sample[phase] for sample in samples) if samples else 0
+        if not mean:
+            continue
+        for sample in samples:
+            cpustate = sample[3].get('cpustate') or dict()
+            points.append((sample[3]['timestamp'], cpustate.get('mhz'), sample[phase]/mean))
+    return points
+
+def printdrift(results):
+    ''' Warn when sample times correlate with the order they were taken in, or with the measured cpu frequency '''
+    phases = [('comp', 1)] if cfgConfig['skipdecomp'] else [('comp', 1), ('decomp', 2)]
+    warnings = []
+    print(f"\n {'Drift check':12} {'vs order':>9} {'vs MHz':>9}")
+    for phase, index in phases:
+        points = driftsamples(results, index)
+        if len(points) < 3:
+            continue
+        line = f" {phase:12}"
+        withfreq = [point for point in points if point[1] is not None]
+        for name, pairs in (('order', [(point[0], point[2]) for point in points]),
+                            ('cpu frequency', [(point[1], point[2]) for point in withfreq])):
+            if len(pairs) < 3:
+                line += f" {'-':>9}"
+                continue
+            r = stats.correlation([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+            line += f" {r:+9.2f}"
+            if abs(r) >= cfgRuns['drift_r'] and abs(r) > stats.correlation_critical(len(pairs), cfgRuns['confidence']):
+                warnings.append(f"{phase} times correlate with {name} (r={r:+.2f})")
+        print(line)
+
+    states = [sample[3]['cpustate'] for samples in results.values() for sample in samples if sample[3] and sample[3].get('cpustate')]
+    for key, unit in (('mhz', 'MHz'), ('temp', 'C')):
+        values = [state[key] for state in states if state.get(key) is not None]
+        if values:
+            print(f" cpu {key:8} {min(values):9.0f} - {max(values):.0f} {unit}")
+    for warning in warnings:
+        print(f"{cli.RED}Warning{cli.RESET}: {warning}, results may be biased by thermal or frequency drift")
+
+def baselevels():
     levels = list(range(cfgRuns['minlevel'],cfgRuns['maxlevel']+1))
     for strategy in cfgRuns['strategies']:
         levels.append(strategy)
     return levels
 
+def getlevels():
+    ''' Return levels to benchmark, the level keys of every parameter combination when a matrix is configured '''
+    if matrix.active():
+        return matrix.keys(baselevels())
+    return baselevels()
+
 def calculate(results, tempfiles):
     ''' Calculate benchmark results '''
     totsize, totsize2 = [0]*2
     totcomppct, totcomppct2 = [0]*2
     totcomptime, totcomptime2 = [0]*2
     totdecomptime, totdecomptime2 = [0]*2
+    totavgcomptime, totavgcomptime2 = [0]*2
+    totavgdecomptime, totavgdecomptime2 = [0]*2
     res_comp, res_decomp, res_totals = dict(), dict(), dict()
 
+    # Results per level after trimming, adaptive levels each have their own count in comp['runs']
     numresults = cfgRuns['runs'] - cfgRuns['trimworst']
+    numsamples = 0
     numlevels = len(getlevels())
+    numlevels2 = len([level for level in map(str, getlevels()) if matrix.split(level)[0] != '0'])
 
     # Calculate and print stats per level
     for level in map(str, getlevels()):
@@ -139,7 +483,7 @@ def calculate(results, tempfiles):
         rawcomptimes = []
         rawdecomptimes = []
         for run in results[level]:
-            rsize,rcompt,rdecompt = run
+            rsize,rcompt,rdecompt = run[:3]
             rawcomptimes.append(rcompt)
             rawdecomptimes.append(rdecompt)
             if comp['compsize'] is not None and comp['compsize'] != rsize:
@@ -150,14 +494,27 @@ def calculate(results, tempfiles):
         # Trim the worst results
         comptimes = trimworst(rawcomptimes)
         decomptimes = trimworst(rawdecomptimes)
+        comp['runs'] = len(results[level])
+        numsamples += len(comptimes)
 
         # Compute averages
         comp['avgtime']   = statistics.mean(comptimes)
         decomp['avgtime'] = statistics.mean(decomptimes)
         comp['avgpct'] = float(rsize*100)/origsize
+        comp['origsize'] = origsize
+
+        # Compute throughput in MB/s of uncompressed data
+        comp['mbps']   = origsize/1000000/comp['avgtime'] if comp['avgtime'] else 0.0
+        decomp['mbps'] = origsize/1000000/decomp['avgtime'] if decomp['avgtime'] else 0.0
 
-        # Compute stddev
-        if numresults >= 2:
+        # Average perf counters or resource usage over the same runs as the times, leaving out the worst
+        comp['counters']   = meancounters([run[3]['comp'] for run in trimruns(results[level], 1)])
+        decomp['counters'] = meancounters([run[3]['decomp'] for run in trimruns(results[level], 2)])
+
+        # Compute stddev and relative width of the confidence interval
+        comp['ciwidth']   = stats.ci_relwidth(comptimes, cfgRuns['confidence'])
+        decomp['ciwidth'] = stats.ci_relwidth(decomptimes, cfgRuns['confidence'])
+        if len(comptimes) >= 2:
             comp['stddev']   = statistics.stdev(comptimes, comp['avgtime'])
             decomp['stddev'] = statistics.stdev(decomptimes, decomp['avgtime'])
         else:
@@ -178,11 +535,15 @@ def calculate(results, tempfiles):
         totcomppct += comp['avgpct']
         totcomptime += tmp_comptime
         totdecomptime += tmp_decomptime
-        if level != 0:
+        totavgcomptime += comp['avgtime']
+        totavgdecomptime += decomp['avgtime']
+        if matrix.split(level)[0] != '0':
             totsize2 += rsize
             totcomppct2 += comp['avgpct']
             totcomptime2 += tmp_comptime
             totdecomptime2 += tmp_decomptime
+            totavgcomptime2 += comp['avgtime']
+            totavgdecomptime2 += decomp['avgtime']
 
         # Put this levels results into the aggregate
         res_comp[level] = dict(comp.items())
@@ -190,16 +551,17 @@ def calculate(results, tempfiles):
 
     ### Totals
     res_totals['numresults'] = numresults
+    res_totals['numsamples'] = numsamples
     res_totals['numlevels'] = numlevels
     res_totals['totsize'] = totsize
 
     # Compression
     res_totals['totcomptime'] = totcomptime
     res_totals['avgcomppct'] = totcomppct/numlevels
-    res_totals['avgcomptime'] = totcomptime/(numlevels*numresults)
+    res_totals['avgcomptime'] = totavgcomptime/numlevels
     if cfgRuns['minlevel'] == 0:
-        res_totals['avgcomppct2'] = totcomppct2/(numlevels-1)
-        res_totals['avgcomptime2'] = totcomptime2/((numlevels-1)*numresults)
+        res_totals['avgcomppct2'] = totcomppct2/numlevels2
+        res_totals['avgcomptime2'] = totavgcomptime2/numlevels2
 
     # Decompression
     if cfgConfig['skipdecomp']:
@@ -207,32 +569,191 @@ def calculate(results, tempfiles):
         res_totals['avgdecomptime'], res_totals['avgdecompstr'], res_totals['totdecompstr'] = [''] * 3
         res_totals['avgdecomptime2'], res_totals['avgdecompstr2'], res_totals['totdecompstr2'] = [''] * 3
     else:
-        res_totals['avgdecomptime'] = totdecomptime/(res_totals['numlevels'] * res_totals['numresults'])
+        res_totals['avgdecomptime'] = totavgdecomptime/res_totals['numlevels']
         res_totals['avgdecompstr'] = f"{res_totals['avgdecomptime']:.4f}"
         res_totals['totdecompstr'] = f"{totdecomptime:.4f}"
         if cfgRuns['minlevel'] == 0:
-            res_totals['avgdecomptime2'] = totdecomptime2/((res_totals['numlevels'] - 1) * res_totals['numresults'])
+            res_totals['avgdecomptime2'] = totavgdecomptime2/numlevels2
             res_totals['avgdecompstr2'] = f"{res_totals['avgdecomptime2']:.4f}"
             res_totals['totdecompstr2'] = f"{totdecomptime2:.4f}"
 
     return res_comp, res_decomp, res_totals
 
+def meancounters(samples):
+    ''' Average each perf counter over the samples it was counted in '''
+    counters = dict()
+    for event in {event for sample in samples for event in sample}:
+        values = [sample[event] for sample in samples if sample.get(event) is not None]
+        counters[event] = statistics.mean(values) if values else None
+    return counters
+
+def countermetrics(counters,origsize):
+    ''' Derive IPC, cycles per byte and misses per KiB of uncompressed data from perf counters '''
+    metrics = dict()
+    byname = {event.split(':')[0]: value for event, value in counters.items()}
+    if byname.get('cycles') and byname.get('instructions') is not None:
+        metrics['IPC'] = byname['instructions'] / byname['cycles']
+    if byname.get('cycles') is not None:
+        metrics['Cycles/B'] = byname['cycles'] / origsize
+    for event, value in counters.items():
+        if 'miss' in event and value is not None:
+            metrics[f"{event.split(':')[0]}/KiB"] = value / (origsize/1024)
+    return metrics
+
+def reportphases(comp,decomp):
+    ''' Return (phase, results) of the phases that were measured '''
+    if cfgConfig['skipdecomp']:
+        return [('comp', comp)]
+    if cfgConfig['decomp_only']:
+        return [('decomp', decomp)]
+    return [('comp', comp), ('decomp', decomp)]
+
+def printcounters(comp,decomp):
+    ''' Print table of metrics derived from perf counters '''
+    phases = reportphases(comp,decomp)
+    rows = []
+    for level in map(str, getlevels()):
+        for phase, result in phases:
+            rows.append((level, phase, countermetrics(result[level]['counters'], comp[level]['origsize'])))
+
+    names = list(dict.fromkeys(name for row in rows for name in row[2]))
+    if not names:
+        return
+
+    print(f"\n {'Level':5} {'Phase':6} " + ' '.join(f"{name:>{max(len(name), 10)}}" for name in names))
+    for level, phase, metrics in rows:
+        values = [f"{metrics[name]:{max(len(name), 10)}.3f}" if name in metrics else f"{'-':>{max(len(name), 10)}}" for name in names]
+        print(f" {level:5} {phase:6} " + ' '.join(values))
+
+def pareto(comp):
+    ''' Find levels dominated on compression ratio versus compression speed, returns dict of level: dominating level '''
+    dominated = dict()
+    for level, result in comp.items():
+        for other, otherresult in comp.items():
+            if (other != level and otherresult['avgpct'] <= result['avgpct'] and otherresult['mbps'] >= result['mbps'] and
+                    (otherresult['avgpct'] < result['avgpct'] or otherresult['mbps'] > result['mbps'])):
+                dominated[level] = other
+                break
+    return dominated
+
+def printthroughput(comp,decomp):
+    ''' Print throughput table and the speed/ratio pareto frontier '''
+    levels = list(map(str, getlevels()))
+    if cfgConfig['decomp_only']:
+        # Compression was not measured, so there is no speed/ratio tradeoff to show
+        print(f"\n {'Level':5} {'Comp':>8} {'Decomp MB/s':>12} {'Cycles/B':>9}")
+        for level in levels:
+            cyclesperbyte = countermetrics(decomp[level]['counters'], comp[level]['origsize']).get('Cycles/B')
+            line = f" {level:5} {comp[level]['avgpct']:7.3f}% {decomp[level]['mbps']:12.2f}"
+            print(line + (f" {cyclesperbyte:9.2f}" if cyclesperbyte is not None else f" {'-':>9}"))
+        return
+
+    dominated = pareto({level: comp[level] for level in levels})
+
+    header = f"\n {'Level':5} {'Comp':>8} {'Comp MB/s':>10}"
+    if not cfgConfig['skipdecomp']:
+        header += f" {'Decomp MB/s':>12}"
+    print(f"{header} {'Cycles/B':>9}  Pareto (ratio vs compression speed)")
+
+    for level in levels:
+        line = f" {level:5} {comp[level]['avgpct']:7.3f}% {comp[level]['mbps']:10.2f}"
+        if not cfgConfig['skipdecomp']:
+            line += f" {decomp[level]['mbps']:12.2f}"
+        cyclesperbyte = countermetrics(comp[level]['counters'], comp[level]['origsize']).get('Cycles/B')
+        line += f" {cyclesperbyte:9.2f}" if cyclesperbyte is not None else f" {'-':>9}"
+        if level in dominated:
+            line += f"  dominated by {dominated[level]}"
+        else:
+            line += f"  {cli.GREEN}frontier{cli.RESET}"
+        print(line)
+
+def printmatrix(comp,decomp):
+    ''' Print results of every parameter combination, the fastest compression of each level is highlighted '''
+    keys = list(map(str, getlevels()))
+    dimensions = [(name, tag) for name, tag in matrix.DIMENSIONS if cfgMatrix[name]]
+    fastest = dict()
+    for key in keys:
+        level = matrix.split(key)[0]
+        fastest[level] = max(fastest.get(level, 0.0), comp[key]['mbps'])
+
+    header = f"\n {'Level':5}" + ''.join(f" {name:>11}" for name, tag in dimensions) + f" {'Comp':>8}"
+    if not cfgConfig['decomp_only']:
+        header += f" {'Comp MB/s':>10}"
+    if not cfgConfig['skipdecomp']:
+        header += f" {'Decomp MB/s':>12}"
+    print(f"{header} {'Mem KiB':>8} {'Compressed size':>15}")
+
+    for key in keys:
+        level, params = matrix.split(key)
+        line = f" {level:5}" + ''.join(f" {params[name]:11}" for name, tag in dimensions) + f" {comp[key]['avgpct']:7.3f}%"
+        mbps = comp[key]['mbps']
+        if not cfgConfig['decomp_only']:
+            if mbps == fastest[level] and len(keys) > len(fastest):
+                line += f" {cli.padstr(f'{cli.GREEN}{mbps:.2f}{cli.RESET}', 10)}"
+            else:
+                line += f" {mbps:10.2f}"
+        if not cfgConfig['skipdecomp']:
+            line += f" {decomp[key]['mbps']:12.2f}"
+        print(f"{line} {matrix.memory(params)//1024:8} {comp[key]['compsize']:15,}")
+
+def printrusage(comp,decomp):
+    ''' Print table of resource usage collected with wait4 '''
+    phases = reportphases(comp,decomp)
+    print(f"\n {'Level':5} {'Phase':6} {'User':>8} {'Sys':>8} {'Wall':>8} {'Max RSS':>12} {'Minor faults':>13} {'Major faults':>13}")
+    for level in map(str, getlevels()):
+        for phase, result in phases:
+            usage = result[level]['counters']
+            if not usage:
+                continue
+            print(f" {level:5} {phase:6} {usage['user']:8.4f} {usage['sys']:8.4f} {usage['wall']:8.4f} {usage['maxrss']/1024:8.1f} MiB"
+                  f" {usage['minflt']:13,.0f} {usage['majflt']:13,.0f}")
+
+def printstaging():
+    ''' Print how testdata is staged '''
+    info = staging.describe()
+    line = f"Staging: {info['mode']} temp_path: {info['fstype'] or 'unknown'}"
+    if info['hugepages']:
+        line += " hugepages: THP"
+    if info['numa_node'] >= 0:
+        line += f" NUMA node: {info['numa_node']}"
+    print(line)
+
+def printtool():
+    ''' Print information about the tool being benchmarked '''
+    if cfgConfig['engine'] == 'ctypes':
+        print(f"Engine: ctypes Library: {cfgConfig['engine_lib']} Version: {engine.version()} Loops: {cfgConfig['engine_loops']}")
+    elif cfgBisect['good']:
+        print(f"Tool: {cfgRuns['testtool']} built from {cfgBisect['repo']}")
+    else:
+        print(f"Tool: {os.path.realpath(cfgRuns['testtool'])} Size: {os.path.getsize(cfgRuns['testtool']):,} B")
+
 def printreport(comp,decomp,totals):
     ''' Print results table '''
     # Print config info
 
     print("\n")
     util.printsysinfo()
-    print(f"Tool: {cfgRuns['testtool']} Size: {os.path.getsize(cfgRuns['testtool']):,} B")
+    printtool()
+    printstaging()
     levelrange = f"{cfgRuns['minlevel']}-{cfgRuns['maxlevel']}"
     print(f"Levels: {levelrange:10}")
-    print(f"Runs: {str(cfgRuns['runs']):10} Trim worst: {str(cfgRuns['trimworst']):10}")
-
-    # Print header
+    if cfgRuns['adaptive']:
+        print(f"Runs: adaptive {cfgRuns['minruns']}-{cfgRuns['maxruns']}, until {cfgRuns['confidence']:.0%} confidence interval is narrower than {cfgRuns['ci_width']:.1%}")
+    else:
+        print(f"Runs: {str(cfgRuns['runs']):10} Trim worst: {str(cfgRuns['trimworst']):10}")
+    print(f"Order: {cfgRuns['order']}")
+    if cfgConfig['decomp_only']:
+        print("Decompression only: each level was compressed once, compression times are not measured")
+
+    # Print header, the level column widens to fit matrix level keys
+    width = max([5] + [len(level) for level in map(str, getlevels())])
+    adaptivestr = "  Runs   CI width" if cfgRuns['adaptive'] else ""
     if cfgConfig['skipdecomp']:
-        print("\n Level   Comp   Comptime min/avg/max/stddev   Compressed size")
+        print(f"\n {'Level':{width}}   Comp   Comptime min/avg/max/stddev   Compressed size{adaptivestr}")
+    elif cfgConfig['decomp_only']:
+        print(f"\n {'Level':{width}}   Comp   Decomptime min/avg/max/stddev  Compressed size{adaptivestr}")
     else:
-        print("\n Level   Comp   Comptime min/avg/max/stddev  Decomptime min/avg/max/stddev  Compressed size")
+        print(f"\n {'Level':{width}}   Comp   Comptime min/avg/max/stddev  Decomptime min/avg/max/stddev  Compressed size{adaptivestr}")
 
     for level in map(str, getlevels()):
         # Print level results
@@ -241,44 +762,734 @@ def printreport(comp,decomp,totals):
         if not cfgConfig['skipdecomp']:
             decompstr = cli.resultstr(decomp[level],30)
 
-        print(f" {level:5}{comp[level]['avgpct']:7.3f}% {compstr} {decompstr}  {comp[level]['compsize']:15,}")
+        adaptivestr = ""
+        if cfgRuns['adaptive']:
+            ciwidth = comp[level]['ciwidth'] if cfgConfig['skipdecomp'] else max(comp[level]['ciwidth'], decomp[level]['ciwidth'])
+            adaptivestr = f"  {comp[level]['runs']:4} {ciwidth:9.2%}"
+
+        # Compression times are not measured in decomp-only mode, leave their column out
+        if cfgConfig['decomp_only']:
+            print(f" {level:{width}}{comp[level]['avgpct']:7.3f}% {decompstr}  {comp[level]['compsize']:15,}{adaptivestr}")
+        else:
+            print(f" {level:{width}}{comp[level]['avgpct']:7.3f}% {compstr} {decompstr}  {comp[level]['compsize']:15,}{adaptivestr}")
 
     # Print totals
-    print(f"\n {'avg1':5}{totals['avgcomppct']:7.3f}% {totals['avgcomptime']:28.4f} {totals['avgdecompstr']:>30}")
-    if cfgRuns['minlevel'] == 0:
-        print(f" {'avg2':5}{totals['avgcomppct2']:7.3f}% {totals['avgcomptime2']:28.4f} {totals['avgdecompstr2']:>30}")
+    if cfgConfig['decomp_only']:
+        print(f"\n {'avg1':{width}}{totals['avgcomppct']:7.3f}% {totals['avgdecompstr']:>30}")
+        if cfgRuns['minlevel'] == 0:
+            print(f" {'avg2':{width}}{totals['avgcomppct2']:7.3f}% {totals['avgdecompstr2']:>30}")
+    else:
+        print(f"\n {'avg1':{width}}{totals['avgcomppct']:7.3f}% {totals['avgcomptime']:28.4f} {totals['avgdecompstr']:>30}")
+        if cfgRuns['minlevel'] == 0:
+            print(f" {'avg2':{width}}{totals['avgcomppct2']:7.3f}% {totals['avgcomptime2']:28.4f} {totals['avgdecompstr2']:>30}")
 
-    if cfgConfig['skipdecomp']:
-        print(f" {'tot':5} {'':8}{totals['totcomptime']:28.4f}   {totals['totsize']:15,}")
+    if cfgConfig['decomp_only']:
+        print(f" {'tot':{width}} {'':8}{totals['totdecompstr']:>30}  {totals['totsize']:15,}")
+    elif cfgConfig['skipdecomp']:
+        print(f" {'tot':{width}} {'':8}{totals['totcomptime']:28.4f}   {totals['totsize']:15,}")
     else:
-        print(f" {'tot':5} {'':8}{totals['totcomptime']:28.4f} {totals['totdecompstr']:>30}  {totals['totsize']:15,}")
+        print(f" {'tot':{width}} {'':8}{totals['totcomptime']:28.4f} {totals['totdecompstr']:>30}  {totals['totsize']:15,}")
+
+    if matrix.active():
+        printmatrix(comp,decomp)
+    else:
+        printthroughput(comp,decomp)
+
+    if cfgConfig['use_rusage']:
+        printrusage(comp,decomp)
+    elif cfgConfig['use_perf'] and cfgConfig['perf_events']:
+        printcounters(comp,decomp)
+
+def testtools():
+    ''' Return list of the testtools being benchmarked '''
+    if cfgRuns['tools']:
+        return list(cfgRuns['tools'])
+    return [cfgRuns['testtool']] + ([cfgRuns['compare_tool']] if cfgRuns['compare_tool'] else [])
+
+def tooljobs(tools):
+    ''' Build job list interleaving the tools for every run of every level, skipping levels a tool does not support '''
+    rng = random.Random(cfgRuns['seed'])
+    jobs = []
+    for run in range(1,cfgRuns['runs']+1):
+        for level in levelorder(run, list(map(str, getlevels()))):
+            group = [(run, level, tool) for tool in tools if matrix.split(level)[0] in adapters.levels(tool)]
+            if cfgRuns['ab_order'] == 'random':
+                rng.shuffle(group)
+            jobs.extend(group)
+    return jobs
+
+def abcompare(times_a, times_b):
+    ''' Compare times of tool A and B, speedup > 1 means B is faster '''
+    speedup = statistics.mean(times_a) / statistics.mean(times_b) if statistics.mean(times_b) else math.nan
+    low, high = stats.bootstrap_ratio(times_a, times_b, cfgRuns['confidence'], seed=cfgRuns['seed'])
+    pvalue = stats.mannwhitney(times_a, times_b)
+    marker = '*' if pvalue < 1 - cfgRuns['confidence'] else ' '
+    return f"{speedup:7.3f}x [{low:5.3f}-{high:5.3f}] p={pvalue:5.3f}{marker}"
+
+def printabreport(results, tempfiles):
+    ''' Print comparison table of tool A and B '''
+    tool_a, tool_b = cfgRuns['testtool'], cfgRuns['compare_tool']
+
+    print("\n")
+    util.printsysinfo()
+    print(f"A: {os.path.realpath(tool_a)} Size: {os.path.getsize(tool_a):,} B")
+    print(f"B: {os.path.realpath(tool_b)} Size: {os.path.getsize(tool_b):,} B")
+    print(f"Runs: {str(cfgRuns['runs']):10} Trim worst: {str(cfgRuns['trimworst']):10} Order: {cfgRuns['ab_order']}")
+    print(f"Speedup is time A / time B, with {cfgRuns['confidence']:.0%} bootstrap confidence interval and Mann-Whitney U p-value, * marks significant differences")
+    if cfgConfig['decomp_only']:
+        print("Decompression only: both tools decompress the same compressed artifacts")
+
+    # Print header
+    header = f"\n {'Level':5}"
+    if not cfgConfig['decomp_only']:
+        header += f" {'Comp A':>8} {'Comp B':>8} {'Comp speedup':>33}"
+    if not cfgConfig['skipdecomp']:
+        header += f" {'Decomp A':>8} {'Decomp B':>8} {'Decomp speedup':>33}"
+    print(f"{header}  Compressed size")
+
+    for level in map(str, getlevels()):
+        line = f" {level:5}"
+        if not cfgConfig['decomp_only']:
+            comptimes_a = trimworst([sample[1] for sample in results[tool_a][level]])
+            comptimes_b = trimworst([sample[1] for sample in results[tool_b][level]])
+            line += f" {statistics.mean(comptimes_a):8.4f} {statistics.mean(comptimes_b):8.4f} {abcompare(comptimes_a, comptimes_b)}"
+
+        if not cfgConfig['skipdecomp']:
+            decomptimes_a = trimworst([sample[2] for sample in results[tool_a][level]])
+            decomptimes_b = trimworst([sample[2] for sample in results[tool_b][level]])
+            line += f" {statistics.mean(decomptimes_a):8.4f} {statistics.mean(decomptimes_b):8.4f} {abcompare(decomptimes_a, decomptimes_b)}"
+
+        size_a, size_b = results[tool_a][level][0][0], results[tool_b][level][0][0]
+        if size_a == size_b:
+            line += f"  {size_a:15,}"
+        else:
+            line += f"  {cli.RED}A: {size_a:,} B: {size_b:,} ({(size_b - size_a)*100/size_a:+.3f}%){cli.RESET}"
+        print(line)
+
+def printtoolsreport(results, tempfiles):
+    ''' Print compression ratio and throughput of all tools side by side, the fastest tool of each level is highlighted '''
+    tools = list(results)
+    print("\n")
+    util.printsysinfo()
+    for tool in tools:
+        print(f"{toollabel(results,tool)}: {os.path.realpath(tool)} Adapter: {adapters.name(tool)} Levels: {adapters.find(tool)['levels']} Size: {os.path.getsize(tool):,} B")
+    print(f"Runs: {str(cfgRuns['runs']):10} Trim worst: {str(cfgRuns['trimworst']):10} Order: {cfgRuns['order']}, tools {cfgRuns['ab_order']}")
+    if cfgConfig['decomp_only']:
+        print("Decompression only: all tools decompress the same compressed artifacts")
+
+    # Columns per tool, with the sample field each throughput is computed from
+    columns = [('Ratio', 8, None)]
+    if not cfgConfig['decomp_only']:
+        columns.append(('Comp MB/s', 10, 1))
+    if not cfgConfig['skipdecomp']:
+        columns.append(('Decomp MB/s', 12, 2))
+    width = sum(colwidth + 1 for name, colwidth, field in columns) - 1
+
+    print(f"\n {'':5}" + ''.join(f" {toollabel(results,tool):^{width}}" for tool in tools))
+    print(f" {'Level':5}" + ''.join(f" {name:>{colwidth}}" for tool in tools for name, colwidth, field in columns))
+    for level in map(str, getlevels()):
+        origsize = tempfiles[level]['origsize']
+        mbps = dict()
+        for tool in [tool for tool in tools if results[tool][level]]:
+            for name, colwidth, field in columns[1:]:
+                avgtime = statistics.mean(trimworst([sample[field] for sample in results[tool][level]]))
+                mbps[(tool, field)] = origsize/1000000/avgtime if avgtime else 0.0
+        line = f" {level:5}"
+        for tool in tools:
+            for name, colwidth, field in columns:
+                if not results[tool][level]:
+                    line += f" {'-':>{colwidth}}"
+                elif field is None:
+                    line += f" {results[tool][level][0][0]*100/origsize:{colwidth-1}.3f}%"
+                elif mbps[(tool, field)] == max(value for (other, otherfield), value in mbps.items() if otherfield == field):
+                    line += f" {cli.padstr(f'{cli.GREEN}{mbps[(tool, field)]:.2f}{cli.RESET}', colwidth)}"
+                else:
+                    line += f" {mbps[(tool, field)]:{colwidth}.2f}"
+        print(line)
+
+def runinfo(tempfiles):
+    ''' Collect information identifying a benchmark, for storing in the results database '''
+    info = dict()
+    info['tool'] = engine.loadedpath if cfgConfig['engine'] == 'ctypes' else os.path.realpath(cfgRuns['testtool'])
+    if os.path.isfile(info['tool']):
+        info['tool_hash'] = util.hashfile(info['tool'])
+        info['tool_size'] = os.path.getsize(info['tool'])
+        info['git_rev'] = util.gitrevision(os.path.dirname(info['tool']))
+    else:
+        info['tool_hash'], info['tool_size'], info['git_rev'] = None, None, None
+    info['sysinfo'] = util.sysinfo()
+    info['staging'] = staging.describe()
+    info['config'] = {'Testruns': cfgRuns, 'Config': cfgConfig, 'Tuning': cfgTuning,
+                      'testdata': {level: {'hash': tempfiles[level]['hash'], 'origsize': tempfiles[level]['origsize']}
+                                   for level in tempfiles}}
+    return info
+
+def storeresults(results, comp, decomp, totals, tempfiles):
+    ''' Store results in the results database, and compare against an earlier run if requested '''
+    if not resultsdb.dbfile:
+        return
+    info = runinfo(tempfiles)
+    runid = resultsdb.store(results, comp, decomp, totals, info)
+    print(f"\nStored results as run {runid} in {resultsdb.dbfile}")
+
+    if cfgConfig['mark_baseline']:
+        resultsdb.mark_baseline(runid)
+        print(f"Run {runid} is now the baseline")
+
+    if cfgConfig['compare_to']:
+        resultsdb.compare(cfgConfig['compare_to'], results, info, list(map(str, getlevels())), cfgRuns['confidence'], trimworst)
+
+def sweepoffsets(srcsize,size):
+    ''' Return offsets of the slices of given size, spread evenly over the source file '''
+    slices = cfgSweep['slices']
+    if slices == 1:
+        return [0]
+    return [index * (srcsize - size) // (slices - 1) for index in range(slices)]
+
+def runslices(srcbuf,slices,level,verify):
+    ''' Compress, then decompress each (offset, size) slice of srcbuf with the ctypes engine.
+        Returns [compsize, comptime, decomptime] per slice and whether verification failed '''
+    wbits = engine.WBITS[streamformat()]
+    complevel, strategy = engine.parselevel(level)
+    slots = [engine.bound(size) for offset, size in slices]
+    compbuf = engine.buffer(sum(slots), cfgConfig['staging_hugepages'])
+    samples = []
+
+    # Compress
+    slotoffset = 0
+    for (offset, size), slotsize in zip(slices, slots):
+        compsize, comptime = engine.deflate(engine.address(srcbuf, offset), size, engine.address(compbuf, slotoffset),
+                                           slotsize, complevel, strategy, wbits)
+        samples.append([compsize, comptime, 0])
+        slotoffset += slotsize
+
+    # Decompress
+    hashfail = 0
+    if not cfgConfig['skipdecomp'] or verify:
+        decompbuf = engine.buffer(max(size for offset, size in slices), cfgConfig['staging_hugepages'])
+        slotoffset = 0
+        for (offset, size), slotsize, sample in zip(slices, slots, samples):
+            decompsize, sample[2] = engine.inflate(engine.address(compbuf, slotoffset), sample[0], engine.address(decompbuf), size, wbits)
+            # ctypes buffers export '<c' items that never compare equal to bytes, cast to unsigned bytes first
+            if verify and (decompsize != size or memoryview(decompbuf).cast('B')[:size] != srcbuf[offset:offset+size]):
+                hashfail = 1
+            slotoffset += slotsize
+    return samples, hashfail
+
+def runsweep(srcbuf,srcsize,sizes):
+    ''' Compress and decompress slices of every size for each level, returns per call samples as results[level][size] '''
+    results = {level: {size: [] for size in sizes} for level in map(str, getlevels())}
+
+    for run in range(1,cfgRuns['runs']+1):
+        print(f"Starting run {run} of {cfgRuns['runs']}")
+        verify = run == 1 and not cfgConfig['skipverify']
+        for level in map(str, getlevels()):
+            cli.printnn(f"Testing level {level}:")
+            for size in sizes:
+                samples, hashfail = runslices(srcbuf, [(offset, size) for offset in sweepoffsets(srcsize, size)], level, verify)
+                if hashfail:
+                    print(f"ERROR: level {level} size {size} failed verification")
+                cli.printnn(f" {size:,}")
+                results[level][size].append([sum(sample[0] for sample in samples),
+                                             statistics.fmean(sample[1] for sample in samples),
+                                             statistics.fmean(sample[2] for sample in samples)])
+            print()
+    return results
+
+def printsweep(results,sizes):
+    ''' Print latency per call and throughput as a function of input size '''
+    header = f"\n {'Level':5} {'Size':>10} {'Comp':>8} {'Comp ns/call':>13} {'Comp MB/s':>10}"
+    if not cfgConfig['skipdecomp']:
+        header += f" {'Decomp ns/call':>15} {'Decomp MB/s':>12}"
+    print(header)
+
+    for level in map(str, getlevels()):
+        for size in sizes:
+            samples = results[level][size]
+            comppct = samples[0][0]*100 / (size*cfgSweep['slices'])
+            comptime = statistics.mean(trimworst([sample[1] for sample in samples]))
+            line = f" {level:5} {size:10,} {comppct:7.3f}% {comptime*1e9:13,.0f} {size/1000000/comptime if comptime else 0.0:10.2f}"
+            if not cfgConfig['skipdecomp']:
+                decomptime = statistics.mean(trimworst([sample[2] for sample in samples]))
+                line += f" {decomptime*1e9:15,.0f} {size/1000000/decomptime if decomptime else 0.0:12.2f}"
+            print(line)
+
+def benchsweep():
+    ''' Benchmark slices of the single testfile across a range of input sizes '''
+    srcfile = util.findfile(cfgSingle['testfile'])
+    srcsize = os.path.getsize(srcfile)
+    sizes = [size for size in cfgSweep['sizes'] if size <= srcsize]
+    print(f"Activated sweep mode, {cfgSweep['slices']} slices per size")
+    printfile(f"{cfgRuns['minlevel']}-{cfgRuns['maxlevel']}", srcfile)
+    if len(sizes) < len(cfgSweep['sizes']):
+        print(f"Warning: skipping sizes larger than the testfile: {', '.join(str(size) for size in cfgSweep['sizes'] if size > srcsize)}")
+
+    # Slices point straight into a private mapping of the testfile, nothing is copied
+    with open(srcfile, 'rb') as f:
+        srcbuf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if hasattr(mmap, 'MADV_WILLNEED'):
+        srcbuf.madvise(mmap.MADV_WILLNEED)
+
+    util.cputweak(True)
+    results = runsweep(srcbuf, srcsize, sizes)
+    util.cputweak(False)
+
+    printsweep(results, sizes)
+    srcbuf.close()
+
+def runcorpus(srcbuf,files):
+    ''' Compress and decompress every corpus file for each level in one batch, returns samples as results[level][file index] '''
+    results = {level: [[] for file in files] for level in map(str, getlevels())}
+    slices = [(file['offset'], file['size']) for file in files]
+
+    for run in range(1,cfgRuns['runs']+1):
+        print(f"Starting run {run} of {cfgRuns['runs']}")
+        verify = run == 1 and not cfgConfig['skipverify']
+        for level in map(str, getlevels()):
+            samples, hashfail = runslices(srcbuf, slices, level, verify)
+            if hashfail:
+                print(f"ERROR: level {level} failed verification")
+            for index, sample in enumerate(samples):
+                results[level][index].append(sample)
+            comptime = sum(sample[1] for sample in samples)
+            decomptime = sum(sample[2] for sample in samples)
+            print(f"Testing level {level}: {comptime:7.4f} {decomptime:7.4f} {sum(sample[0] for sample in samples):15,}")
+    return results
+
+def corpusline(name,contentclass,origsize,compsize,comptime,decomptime):
+    ''' Return formatted line of corpus results '''
+    line = f" {cli.padstr(name[-32:], 32, left=True)} {contentclass:10} {origsize:13,} {compsize*100/origsize:7.3f}% {origsize/1000000/comptime if comptime else 0.0:10.2f}"
+    if not cfgConfig['skipdecomp']:
+        line += f" {origsize/1000000/decomptime if decomptime else 0.0:12.2f}"
+    return line
+
+def printcorpus(results,files):
+    ''' Print results per file, per content class and in total for each level '''
+    header = f" {'File':32} {'Class':10} {'Size':>13} {'Comp':>8} {'Comp MB/s':>10}"
+    if not cfgConfig['skipdecomp']:
+        header += f" {'Decomp MB/s':>12}"
+
+    for level in map(str, getlevels()):
+        print(f"\nLevel {level}\n{header}")
+        classes = dict()
+        for file, samples in zip(files, results[level]):
+            compsize = samples[0][0]
+            comptime = statistics.mean(trimworst([sample[1] for sample in samples]))
+            decomptime = statistics.mean(trimworst([sample[2] for sample in samples]))
+            print(corpusline(file['name'], file['class'], file['size'], compsize, comptime, decomptime))
+            # Sum sizes and times, so each class gets the throughput of its bytes, not an average of its files
+            for key in (file['class'], 'total'):
+                totals = classes.setdefault(key, [0, 0, 0, 0, 0])
+                for index, value in enumerate((1, file['size'], compsize, comptime, decomptime)):
+                    totals[index] += value
+
+        print()
+        for contentclass, (count, origsize, compsize, comptime, decomptime) in sorted(classes.items(), key=lambda item: item[0] == 'total'):
+            print(corpusline(f"{count} file(s)", contentclass, origsize, compsize, comptime, decomptime))
+
+def benchcorpus():
+    ''' Benchmark each file of a corpus directory or tar archive separately '''
+    srcbuf, files = corpus.load(util.findfile(cfgCorpus['path'], allowdir=True))
+    print(f"Activated corpus mode, {len(files)} files {len(srcbuf):,} B from {cfgCorpus['path']}")
+    for contentclass in sorted(set(file['class'] for file in files)):
+        classfiles = [file for file in files if file['class'] == contentclass]
+        print(f"  {contentclass:10} {len(classfiles):5} file(s) {sum(file['size'] for file in classfiles):13,} B")
+
+    util.cputweak(True)
+    results = runcorpus(srcbuf, files)
+    util.cputweak(False)
+
+    printcorpus(results, files)
+
+def scalecounts(cpucount):
+    ''' Return instance counts to test, doubling from 1 up to the number of cpus '''
+    counts = [1]
+    while counts[-1]*2 < cpucount:
+        counts.append(counts[-1]*2)
+    if cpucount > 1:
+        counts.append(cpucount)
+    return counts
+
+def runinstances(commands,files,cpus,output=None):
+    ''' Run commands concurrently from a common start, returns wall time and the cputime of each instance '''
+    env = util.get_env(True)
+    if cfgConfig['use_rusage']:
+        outputs = [output or instfiles['compfile'] for instfiles in files]
+        walltime, usages = util.runbarrier(commands, outputs, cpus, env=env, priority=True, realtime=cfgTuning['use_chrt'])
+        return walltime, [usage['user'] for usage in usages]
+
+    commands = [f"{command_prefix(instfiles['timefile'])} {command}" for command, instfiles in zip(commands, files)]
+    outputs = [output or instfiles['compfile'] for instfiles in files]
+    walltime, usages = util.runbarrier(commands, outputs, cpus, env=env)
+    return walltime, [measurement(instfiles['timefile'], 0)[0] for instfiles in files]
+
+def runscaling(tempfiles,instinputs,cpulist):
+    ''' Run each level with increasing numbers of concurrent instances, returns samples as results[level][count] '''
+    counts = scalecounts(len(cpulist))
+    results = {level: {count: [] for count in counts} for level in map(str, getlevels())}
+
+    for run in range(1,cfgRuns['runs']+1):
+        print(f"Starting run {run} of {cfgRuns['runs']}")
+        verify = run == 1 and not cfgConfig['skipverify'] and adapters.find(cfgRuns['testtool'])['verify'] == 'zlib'
+        for level in map(str, getlevels()):
+            cli.printnn(f"Testing level {level}:")
+            for count in counts:
+                files = [jobfiles(f"-inst{index}") for index in range(count)]
+                inputs = instinputs[tempfiles[level]['filename']][:count]
+                util.runcommand('sync')
+                for filename in inputs:
+                    staging.prepare(filename)
+
+                commands = [compcommand(level, filename) for filename in inputs]
+                compwall, comptimes = runinstances(commands, files, cpulist[:count])
+                compsizes = [os.path.getsize(instfiles['compfile']) for instfiles in files]
+
+                decompwall, decomptimes = 0, [0]
+                if not cfgConfig['skipdecomp']:
+                    for instfiles in files:
+                        staging.prepare(instfiles['compfile'])
+                    commands = [decompcommand(instfiles['compfile'], level=level) for instfiles in files]
+                    decompwall, decomptimes = runinstances(commands, files, cpulist[:count], output=os.devnull)
+
+                if verify and (len(set(compsizes)) != 1 or
+                               verify_zlib(util.filechunks(files[0]['compfile']), tempfiles[level]['hash'], level)):
+                    print(f"ERROR: level {level} with {count} instances failed verification")
+
+                for instfiles in files:
+                    for filename in instfiles.values():
+                        if os.path.exists(filename):
+                            os.unlink(filename)
+
+                cli.printnn(f" {count}")
+                results[level][count].append([compsizes[0], compwall, statistics.fmean(comptimes), decompwall, statistics.fmean(decomptimes)])
+            print()
+    return results
+
+def printscaling(results,tempfiles):
+    ''' Print aggregate throughput, per instance slowdown and scaling efficiency per level '''
+    phases = [('Comp', 1)] if cfgConfig['skipdecomp'] else [('Comp', 1), ('Decomp', 3)]
+    header = f"\n {'Level':5} {'Instances':>9}"
+    for phase, index in phases:
+        header += f" {phase+' MB/s':>12} {'Slowdown':>9} {'Efficiency':>10}"
+    print(header)
+
+    for level in map(str, getlevels()):
+        origsize = tempfiles[level]['origsize']
+        base = dict()
+        for count, samples in results[level].items():
+            line = f" {level:5} {count:9}"
+            for phase, index in phases:
+                walltime = statistics.mean(trimworst([sample[index] for sample in samples]))
+                cputime = statistics.mean(trimworst([sample[index+1] for sample in samples]))
+                if count == 1:
+                    base[phase] = (walltime, cputime)
+                basewall, basecpu = base[phase]
+                # Efficiency is aggregate throughput relative to perfect linear scaling of a single instance
+                line += f" {count*origsize/1000000/walltime:12.2f} {cputime/basecpu:8.2f}x {basewall*100/walltime:9.1f}%"
+            print(line)
+
+def benchscaling(tempfiles):
+    ''' Benchmark concurrent instances of the testtool, each on its own copy of the testfile '''
+    cpulist = util.parse_cpulist(cfgConfig['scale_cpus'])
+    print(f"Activated scaling mode, up to {len(cpulist)} instances on cpus {','.join(map(str, cpulist))}")
+
+    # Give every instance its own input, so they do not share page cache pages
+    instinputs = dict()
+    for level in map(str, getlevels()):
+        filename = tempfiles[level]['filename']
+        if filename not in instinputs:
+            instinputs[filename] = [filename]
+            for index in range(1, len(cpulist)):
+                instfile = runfile(f"deflatebench-inst{index}-{os.path.basename(filename)}")
+                util.copyfile(filename, instfile, tempfiles[level]['hash'])
+                instinputs[filename].append(instfile)
+
+    try:
+        results = runscaling(tempfiles, instinputs, cpulist)
+    finally:
+        for filenames in instinputs.values():
+            for instfile in filenames[1:]:
+                os.unlink(instfile)
+    printscaling(results, tempfiles)
 
 def printfile(level,filename):
     ''' Prints formatted information about file '''
     filesize = os.path.getsize(filename)
     print(f"Level {level}: {filename} {filesize/1024/1024:6.1f} MiB  {filesize:12,} B")
 
-def benchmain():
+def artifactformat(filename):
+    ''' Return stream format of an externally compressed artifact, from its file extension '''
+    formats = {extension: fmt for fmt, extension in engine.EXTENSIONS.items()}
+    extension = os.path.splitext(filename)[1].lstrip('.')
+    if extension not in formats:
+        print(f"Error, unknown artifact format of '{filename}'. Valid extensions are {', '.join('.' + ext for ext in formats)}.")
+        sys.exit(1)
+    return formats[extension]
+
+def compressartifact(tempfiles,level,filename):
+    ''' Compress the testfile of a level into filename, with the testtool or the ctypes engine '''
+    if cfgConfig['engine'] == 'ctypes':
+        origsize = tempfiles[level]['origsize']
+        srcbuf = engine.buffer(origsize)
+        with open(tempfiles[level]['filename'], 'rb') as f:
+            f.readinto(srcbuf)
+        compbuf = engine.buffer(engine.bound(origsize))
+        complevel, strategy = engine.parselevel(level)
+        compsize, _ = engine.deflate(engine.address(srcbuf), origsize, engine.address(compbuf), len(compbuf),
+                                     complevel, strategy, engine.WBITS[streamformat()])
+        with open(filename, 'wb') as f:
+            f.write(memoryview(compbuf)[:compsize])
+    else:
+        util.runcommand(compcommand(level, tempfiles[level]['filename']), env=util.get_env(True), output=filename)
+
+def prepareartifacts(tempfiles,tools):
+    ''' Compress each level once, or load its externally compressed artifact from [Testdata_Artifacts], for decomp-only mode.
+        Artifacts compressed by the testtool are cached by tool hash, level and testfile hash, and decompressed by all tools '''
+    toolhash = list(toolhashes([cfgRuns['testtool']]).values())[0]
+    print("Decompression only, preparing compressed artifacts")
+    for level in map(str, getlevels()):
+        if level in cfgArtifacts:
+            srcfile = util.findfile(cfgArtifacts[level])
+            fmt = artifactformat(srcfile)
+            for tool in tools:
+                if cfgConfig['engine'] != 'ctypes' and not adapters.decompresses(tool, fmt):
+                    print(f"Error, {tool} can only decompress {streamformat(tool)} streams, artifact '{srcfile}' is {fmt}.")
+                    sys.exit(1)
+            filename = runfile(f"deflatebench-{level}.{engine.EXTENSIONS[fmt]}")
+            util.copyfile(srcfile, filename, hashindex.hashfile(srcfile))
+
+            # The testtool output is verified against the content of the artifact, not the testfile
+            orighash, origsize, error = util.verifystream(util.filechunks(filename), engine.WBITS[fmt])
+            if error:
+                print(f"Error, artifact '{srcfile}' is invalid: {error}")
+                sys.exit(1)
+            tempfiles[level]['hash'], tempfiles[level]['origsize'] = orighash, origsize
+            tempfiles[level]['artifact'] = {'filename': filename, 'size': os.path.getsize(filename), 'format': fmt}
+            printfile(f"{level}", srcfile)
+        else:
+            fmt = streamformat()
+            filename, size = cache.artifact(toolhash, level, tempfiles[level]['hash'], fmt,
+                                            lambda filename: compressartifact(tempfiles, level, filename))
+            tempfiles[level]['artifact'] = {'filename': filename, 'size': size, 'format': fmt}
+            printfile(f"{level}", filename)
+
+def profilelevels(tempfiles,tools):
+    ''' Profile compression and decompression of each level with perf record, returns profiles[tool][level][phase] '''
+    env = util.get_env(True)
+    compfile = jobfiles('-profile')['compfile']
+    datafile = runfile('deflatebench-perf.data')
+    outdir = os.path.expanduser(cfgConfig['hotspots_dir'])
+    os.makedirs(outdir, exist_ok=True)
+
+    profiles = dict()
+    for index, tool in enumerate(tools):
+        label = chr(ord('A') + index) if len(tools) > 1 else ''
+        name = f"{os.path.basename(tool)}-{label}" if label else os.path.basename(tool)
+        profiles[tool] = dict()
+        for level in [level for level in map(str, getlevels()) if matrix.split(level)[0] in adapters.levels(tool)]:
+            cli.printnn(f"Profiling level {level}{' ' + label if label else ''}: c")
+            profiles[tool][level] = {'comp': profile.record(compcommand(level, tempfiles[level]['filename'], tool), datafile, env, output=compfile)}
+            if not cfgConfig['skipdecomp']:
+                cli.printnn('d')
+                profiles[tool][level]['decomp'] = profile.record(decompcommand(compfile, tool, level=level), datafile, env)
+            print()
+            for phase, result in profiles[tool][level].items():
+                profile.writefolded(result, os.path.join(outdir, f"{name}-{level}-{phase}.folded"))
+    os.unlink(compfile)
+
+    profile.save(profiles, os.path.join(outdir, 'hotspots.json'))
+    print(f"Folded stacks and hotspots.json written to {outdir}")
+    return profiles
+
+def printhotspots(profiles):
+    ''' Print the functions with the most self time per level and phase '''
+    for tool, levels in profiles.items():
+        print(f"\nHotspots of {tool}\n {'Level':5} {'Phase':6} {'Self':>7}  Function")
+        for level, phases in levels.items():
+            for phase, result in phases.items():
+                for rank, (symbol, pct) in enumerate(profile.top(result, cfgConfig['hotspots_top'])):
+                    prefix = f" {level:5} {phase:6}" if rank == 0 else f" {'':5} {'':6}"
+                    print(f"{prefix} {pct:6.2f}%  {symbol}")
+
+def printhotspotdiff(old,new,oldlabel,newlabel):
+    ''' Print the largest changes in self time per function between two profiles '''
+    print(f"\nHotspot changes from {oldlabel} to {newlabel}\n {'Level':5} {'Phase':6} {'Old':>7} {'New':>7} {'Change':>7}  Function")
+    for level, phases in new.items():
+        for phase, result in phases.items():
+            if phase not in old.get(level, dict()):
+                continue
+            oldpct, newpct = profile.percentages(old[level][phase]), profile.percentages(result)
+            symbols = set(symbol for symbol, pct in profile.top(old[level][phase], cfgConfig['hotspots_top']))
+            symbols |= set(symbol for symbol, pct in profile.top(result, cfgConfig['hotspots_top']))
+            changes = sorted(symbols, key=lambda symbol: -abs(newpct.get(symbol, 0) - oldpct.get(symbol, 0)))
+            for rank, symbol in enumerate(changes[:cfgConfig['hotspots_top']]):
+                prefix = f" {level:5} {phase:6}" if rank == 0 else f" {'':5} {'':6}"
+                print(f"{prefix} {oldpct.get(symbol, 0):6.2f}% {newpct.get(symbol, 0):6.2f}% {newpct.get(symbol, 0) - oldpct.get(symbol, 0):+6.2f}%  {symbol}")
+
+def bisectmeasure(tempfiles,tool,levels):
+    ''' Run the reduced benchmark matrix of one bisect step, returns times[level][phase] '''
+    times = {level: {'comp': [], 'decomp': []} for level in levels}
+    for run in range(1,cfgBisect['runs']+1):
+        for index, level in enumerate(levelorder(run, levels)):
+            compsize,comptime,decomptime,hashfail,extra = runjob(tempfiles,(run, level, tool),index)
+            if hashfail != 0:
+                print(f"ERROR: level {level} failed crc checking")
+            times[level]['comp'].append(comptime)
+            times[level]['decomp'].append(decomptime)
+    return times
+
+def bisectverdict(times,good,bad,regressed):
+    ''' Decide if a bisect step is good or bad by comparing it against both endpoints, returns verdict and details '''
+    alpha = 1 - cfgRuns['confidence']
+    verdicts, details = [], []
+    for level, phase in regressed:
+        step, goodtimes, badtimes = times[level][phase], good[level][phase], bad[level][phase]
+        closer_bad = abs(statistics.mean(step) - statistics.mean(badtimes)) < abs(statistics.mean(step) - statistics.mean(goodtimes))
+        # Only trust a side if the step is also measurably different from the other endpoint
+        if closer_bad and stats.mannwhitney(step, goodtimes) < alpha:
+            verdicts.append('bad')
+        elif not closer_bad and stats.mannwhitney(step, badtimes) < alpha:
+            verdicts.append('good')
+        else:
+            verdicts.append('skip')
+        details.append(f"level {level} {phase} {(statistics.mean(step)/statistics.mean(goodtimes) - 1)*100:+.1f}% vs good")
+
+    if 'bad' in verdicts:
+        return 'bad', ', '.join(details)
+    if all(verdict == 'good' for verdict in verdicts):
+        return 'good', ', '.join(details)
+    return 'skip', ', '.join(details)
+
+def runbisect(tempfiles):
+    ''' Find the commit that made the selected levels slower, building and benchmarking commits between good and bad '''
+    tool = os.path.basename(cfgRuns['testtool'])
+    levels = [level for level in map(str, getlevels()) if not cfgBisect['levels'] or level in bisectlevels()]
+    phases = ['comp'] if cfgConfig['skipdecomp'] else ['comp', 'decomp']
+    good, bad = gitbisect.resolve(cfgBisect['good']), gitbisect.resolve(cfgBisect['bad'])
+    commits = gitbisect.commits(good, bad)
+    if not commits:
+        print(f"Error, '{cfgBisect['bad']}' is not a descendant of '{cfgBisect['good']}'.")
+        return
+    print(f"Bisecting {len(commits)} commits from {gitbisect.subject(good)} to {gitbisect.subject(bad)}, levels {', '.join(levels)}")
+
+    def measure(commit):
+        tooldir = gitbisect.build(commit, [tool])
+        if tooldir is None:
+            return None
+        print(f"Measuring {gitbisect.subject(commit)}")
+        util.cputweak(True)
+        try:
+            return bisectmeasure(tempfiles, os.path.join(tooldir, tool), levels)
+        finally:
+            util.cputweak(False)
+
+    goodtimes, badtimes = measure(good), measure(bad)
+    if goodtimes is None or badtimes is None:
+        print(f"Error, unable to build the good or bad revision, see build.log in {gitbisect.cachedir}")
+        return
+
+    alpha = 1 - cfgRuns['confidence']
+    regressed = [(level, phase) for level in levels for phase in phases
+                 if statistics.mean(badtimes[level][phase]) > statistics.mean(goodtimes[level][phase])
+                 and stats.mannwhitney(badtimes[level][phase], goodtimes[level][phase]) < alpha]
+    if not regressed:
+        print("Error, bad is not significantly slower than good for any selected level, nothing to bisect.")
+        return
+    print(f"Regressed: {', '.join(f'level {level} {phase}' for level, phase in regressed)}")
+
+    # commits[hi] is known bad, lo is the last known good index with -1 meaning the good revision itself
+    lo, hi = -1, len(commits) - 1
+    skipped = set()
+    while hi - lo > 1:
+        candidates = [index for index in range(lo + 1, hi) if index not in skipped]
+        if not candidates:
+            break
+        mid = min(candidates, key=lambda index: abs(index - (lo + hi) / 2))
+        times = measure(commits[mid])
+        if times is None:
+            verdict, details = 'skip', 'build failed'
+        else:
+            verdict, details = bisectverdict(times, goodtimes, badtimes, regressed)
+        print(f"{gitbisect.subject(commits[mid])}: {verdict} ({details})")
+        if verdict == 'good':
+            lo = mid
+        elif verdict == 'bad':
+            hi = mid
+        else:
+            skipped.add(mid)
+
+    if hi - lo == 1:
+        print(f"\nFirst bad commit: {gitbisect.subject(commits[hi])}")
+    else:
+        print("\nUnable to narrow down further, the first bad commit is one of:")
+        for commit in commits[lo + 1:hi + 1]:
+            print(f"  {gitbisect.subject(commit)}")
+
+def bisectlevels():
+    ''' Return list of levels selected for bisecting '''
+    return [level.strip() for level in str(cfgBisect['levels']).split(',') if level.strip()]
+
+def toolhashes(tools):
+    ''' Return hash of each benchmarked tool, or of the engine library '''
+    if cfgConfig['engine'] == 'ctypes':
+        tools = [engine.loadedpath]
+    return {tool: util.hashfile(os.path.realpath(tool)) if os.path.isfile(tool) else None for tool in tools}
+
+def terminate(signum, frame):
+    ''' Signal handler turning termination into an exception, so cleanup still runs '''
+    raise SystemExit(f"Interrupted by signal {signum}, use '--resume' to continue the benchmark.")
+
+def cleanup(completed):
+    ''' Restore system tweaks and remove tempfiles, also when the benchmark failed or was interrupted '''
+    # Disable system tweaks to restore normal powersaving, turbo, etc
+    util.cputweak(False)
+    checkpoint.finish(completed)
+    inputbufs.clear()
+
+    # Clean up tempfiles, including those of jobs that were cut short. Cached files live outside the run directory
+    if rundir:
+        shutil.rmtree(rundir, ignore_errors=True)
+
+def benchmain(resume=False):
     ''' Main benchmarking function '''
-    global timefile, compfile, decompfile
+    global rundir
+    if cfgConfig['engine'] == 'ctypes':
+        engine.load(util.findfile(cfgConfig['engine_lib'], fatal=False) or cfgConfig['engine_lib'])
+
+    # Check and apply staging before any testdata is copied, so its pages are placed accordingly
+    staging.checkfs()
+    if cfgConfig['numa_node'] >= 0:
+        staging.bindnode(cfgConfig['numa_node'])
 
     util.printsysinfo()
-    print(f"Tool: {cfgRuns['testtool']} Size: {os.path.getsize(cfgRuns['testtool']):,} B")
+    printtool()
+    printstaging()
 
-    # Prepare tempfiles
-    timefile = os.path.join(cfgConfig['temp_path'], 'zlib-time.tmp')
-    compfile = os.path.join(cfgConfig['temp_path'], 'zlib-testfil.gz')
-    decompfile = os.path.join(cfgConfig['temp_path'], 'zlib-testfil.raw')
+    if sys.platform != 'win32':
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, terminate)
 
     tempfiles = dict()
+    completed = False
+    rundir = tempfile.mkdtemp(prefix='deflatebench-run-', dir=cfgConfig['temp_path'])
+    try:
+        if cfgRuns['testmode'] == 'sweep':
+            benchsweep()
+        elif cfgRuns['testmode'] == 'corpus':
+            benchcorpus()
+        else:
+            benchlevels(tempfiles, resume)
+        completed = True
+    finally:
+        cleanup(completed)
 
+def benchlevels(tempfiles, resume):
+    ''' Benchmark levels on their testfiles, filling in tempfiles as they are staged '''
     # Single testfile, we just reference the same file for every level
     if cfgRuns['testmode'] == 'single':
-        tmp_filename = os.path.join(cfgConfig['temp_path'], "deflatebench.tmp")
+        tmp_filename = runfile("deflatebench.tmp")
         srcfile = util.findfile(cfgSingle['testfile'])
-        shutil.copyfile(srcfile,tmp_filename)
-        tmp_hash = util.hashfile(tmp_filename)
-        origsize = os.path.getsize(tmp_filename)
+        tmp_hash, origsize = util.copyfile(srcfile,tmp_filename,hashindex.hashfile(srcfile))
         print("Activated single file mode")
         printfile(f"{cfgRuns['minlevel']}-{cfgRuns['maxlevel']}", srcfile)
 
@@ -291,71 +1502,144 @@ def benchmain():
         # Multiple testfiles
         if cfgRuns['testmode'] == 'multi':
             print("Activated multiple file mode.")
-        else:
+        elif cfgGen['model'] == 'repeat':
             print(f"Activated multiple generated file mode. Source: {cfgGen['srcFile']}")
+        elif cfgGen['model'] in ('entropy', 'lz'):
+            print(f"Activated multiple generated file mode. Model: {cfgGen['model']}, seed {cfgGen['seed']}")
+        else:
+            print(f"Activated multiple generated file mode. Model: {cfgGen['model']}, seed {cfgGen['seed']}, source: {cfgGen['srcFile']}")
 
-        for level in map(str, getlevels()):
+        for level in map(str, baselevels()):
             tempfiles[level] = dict()
-            tmp_filename = os.path.join(cfgConfig['temp_path'], f"deflatebench-{level}.tmp")
-            tempfiles[level]['filename'] = tmp_filename
+            tmp_filename = runfile(f"deflatebench-{level}.tmp")
 
             if cfgRuns['testmode'] == 'multi':
                 srcfile = util.findfile(cfgMulti[level])
-                shutil.copyfile(srcfile,tmp_filename)
+                tmp_hash, origsize = util.copyfile(srcfile,tmp_filename,hashindex.hashfile(srcfile))
                 printfile(f"{level}", srcfile)
+            elif cfgGen['model'] != 'repeat':
+                srcfile = util.findfile(cfgGen['srcFile']) if cfgGen['model'] in ('markov', 'shuffle') else None
+                if cfgConfig['gen_cache']:
+                    # Cached by model settings, seed and size, as generating large files takes a while
+                    size = cfgGen[level]
+                    tmp_filename, tmp_hash, origsize = cache.synthetic(synth.settings(), srcfile, size,
+                                                                       lambda filename: synth.generate(srcfile, filename, size))
+                else:
+                    tmp_hash, origsize = synth.generate(srcfile,tmp_filename,cfgGen[level])
+                printfile(f"{level}", tmp_filename)
+            elif cfgConfig['gen_cache']:
+                # Cached testfiles are shared between levels and invocations, and must not be cleaned up
+                tmp_filename, tmp_hash, origsize = cache.testfile(util.findfile(cfgGen['srcFile']),cfgGen[level])
+                printfile(f"{level}", tmp_filename)
             else:
-                util.generate_testfile(util.findfile(cfgGen['srcFile']),tmp_filename,cfgGen[level])
+                tmp_hash, origsize = util.generate_testfile(util.findfile(cfgGen['srcFile']),tmp_filename,cfgGen[level])
                 printfile(f"{level}", tmp_filename)
 
-            tempfiles[level]['hash'] = util.hashfile(tmp_filename)
-            tempfiles[level]['origsize'] = os.path.getsize(tmp_filename)
+            tempfiles[level]['filename'] = tmp_filename
+            tempfiles[level]['hash'] = tmp_hash
+            tempfiles[level]['origsize'] = origsize
+
+        # Every parameter combination of a level benchmarks the testfile of that level
+        if matrix.active():
+            for level in map(str, getlevels()):
+                tempfiles[level] = dict(tempfiles[matrix.split(level)[0]])
+            for level in map(str, baselevels()):
+                del tempfiles[level]
+
+    # Bisect builds commits between measurements, it only tweaks the system while measuring
+    if cfgBisect['good']:
+        runbisect(tempfiles)
+        return
 
     # Tweak system to reduce benchmark variance
     util.cputweak(True)
 
-    # Prepare multilevel results array
+    # Prepare multilevel results array per tool
+    tools = testtools()
     results = dict()
-    for level in map(str, getlevels()):
-        results[level] = []
-
-    # Run tests and record results
-    for run in range(1,cfgRuns['runs']+1):
-        if run != 1:
-            cfgConfig['skipverify'] = True
-
-        print(f"Starting run {run} of {cfgRuns['runs']}")
+    for tool in tools:
+        results[tool] = dict()
         for level in map(str, getlevels()):
-            compsize,comptime,decomptime,hashfail = runtest(tempfiles,level)
-            if hashfail != 0:
-                print(f"ERROR: level {level} failed crc checking")
-            results[level].append( [compsize,comptime,decomptime] )
+            results[tool][level] = []
 
-    res_comp,res_decomp,res_totals = calculate(results, tempfiles)
-    printreport(res_comp,res_decomp,res_totals)
+    if cfgConfig['decomp_only']:
+        prepareartifacts(tempfiles, tools)
 
-    # Disable system tweaks to restore normal powersaving, turbo, etc
-    util.cputweak(False)
+    # Keep collected samples in a checkpoint, so an interrupted benchmark can be resumed
+    if checkpoint.filename and not cfgConfig['scale_cpus']:
+        finished = checkpoint.start(checkpoint.identity(cfgRuns, toolhashes(tools), tempfiles, staging.describe()), resume)
+        if resume:
+            print(f"Resuming from checkpoint '{checkpoint.filename}', {finished} jobs already finished")
 
-    # Clean up tempfiles
-    for level in map(str, getlevels()):
-        if os.path.isfile(tempfiles[level]['filename']):
-            os.unlink(tempfiles[level]['filename'])
+    # Run tests and record results
+    if cfgConfig['scale_cpus']:
+        benchscaling(tempfiles)
+    elif cfgRuns['tools']:
+        runjobs(tempfiles,tooljobs(tools),results)
+        printtoolsreport(results, tempfiles)
+        printdrift({(tool, level): samples for tool in results for level, samples in results[tool].items()})
+    elif cfgRuns['compare_tool']:
+        runjobs(tempfiles,tooljobs(tools),results)
+        printabreport(results, tempfiles)
+        printdrift({(tool, level): samples for tool in results for level, samples in results[tool].items()})
+    elif cfgRuns['adaptive']:
+        runadaptive(tempfiles,results)
+    else:
+        jobs = [(run, level, cfgRuns['testtool']) for run in range(1,cfgRuns['runs']+1) for level in levelorder(run, list(map(str, getlevels())))]
+        runjobs(tempfiles,jobs,results)
+
+    if not cfgRuns['compare_tool'] and not cfgRuns['tools'] and not cfgConfig['scale_cpus']:
+        res_comp,res_decomp,res_totals = calculate(results[cfgRuns['testtool']], tempfiles)
+        printreport(res_comp,res_decomp,res_totals)
+        printdrift(results[cfgRuns['testtool']])
+        storeresults(results[cfgRuns['testtool']], res_comp, res_decomp, res_totals, tempfiles)
+
+    # Profile separately from the measured runs, sampling slows down the testtool
+    if cfgConfig['hotspots']:
+        if cfgConfig['hotspots_diff']:
+            oldtool, oldprofiles = profile.load(os.path.expanduser(cfgConfig['hotspots_diff']))
+        profiles = profilelevels(tempfiles, tools)
+        printhotspots(profiles)
+        if len(tools) == 2:
+            printhotspotdiff(profiles[tools[0]], profiles[tools[1]], f"A {tools[0]}", f"B {tools[1]}")
+        if cfgConfig['hotspots_diff']:
+            printhotspotdiff(oldprofiles, profiles[tools[0]], f"{oldtool} in {cfgConfig['hotspots_diff']}", tools[0])
 
 def main():
     ''' Main function handles command-line arguments and loading the correct config '''
-    global cfgRuns,cfgConfig,cfgTuning,cfgGen,cfgSingle,cfgMulti
+    global cfgRuns,cfgConfig,cfgTuning,cfgTools,cfgGen,cfgSingle,cfgMulti,cfgSweep,cfgCorpus,cfgArtifacts,cfgBisect,cfgMatrix
 
     parser = argparse.ArgumentParser(description='deflatebench - A zlib-ng benchmarking utility. Please see config file for more options.')
     parser.add_argument('-r','--runs', help='Number of benchmark runs.', type=int)
     parser.add_argument('-t','--trimworst', help='Trim the N worst runs per level.', type=int)
+    parser.add_argument('-a','--adaptive', help='Run each level until its confidence interval is narrow enough.', action='store_true')
     parser.add_argument('-p','--profile', help='Load config profile from config file: ~/deflatebench-[PROFILE].conf')
     parser.add_argument('--write-config', help='Write default configfile to ~/deflatebench.conf.', action='store_true')
     parser.add_argument('-s','--single', help='Activate testmode "Single"', action='store_true')
     parser.add_argument('-m','--multi', help='Activate testmode "Multi".', action='store_true')
     parser.add_argument('-g','--gen', help='Activate testmode "Generate".', action='store_true')
-    parser.add_argument('-l','--testtool', help='Path to test tool.', action='store')
+    parser.add_argument('--sweep', help='Activate testmode "Sweep", slices the single testfile into a range of input sizes.', action='store_true')
+    parser.add_argument('--corpus', help='Activate testmode "Corpus", benchmarks each file of a directory or tar archive.', action='store_true')
+    parser.add_argument('-l','--testtool', help='Path to test tool. Given twice, the two tools are compared (A/B mode), given more often they are benchmarked side by side.', action='append')
+    parser.add_argument('--order', help='Order of levels within each run.', choices=['sequential','random','latin'])
     parser.add_argument('--skipdecomp', help='Skip decompression benchmarks.', action='store_true')
-    parser.add_argument('--skipverify', help='Skip verifying compressed files with system gzip.', action='store_true')
+    parser.add_argument('--decomp-only', help='Compress each level once, and only benchmark decompression.', action='store_true')
+    parser.add_argument('--skipverify', help='Skip verifying compressed files with python zlib.', action='store_true')
+    parser.add_argument('--rusage', help='Measure with wait4 rusage instead of perf/time, also reports system/wall time and max RSS.', action='store_true')
+    parser.add_argument('-j','--cpus', help='Run jobs in parallel, pinned to these cpus. Ex: 2,3,6-7', action='store')
+    parser.add_argument('--scale', help='Run 1, 2, 4 .. N concurrent instances per level, pinned to these cpus. Ex: 0-7', action='store')
+    parser.add_argument('--staging', help='How input pages are staged before each measurement.', choices=staging.MODES)
+    parser.add_argument('--numa-node', help='Bind memory and cpus to this NUMA node.', type=int)
+    parser.add_argument('--resume', help='Resume an interrupted benchmark from its checkpoint.', action='store_true')
+    parser.add_argument('--hotspots', help='Profile each level with perf record, and report the functions using the most time.', action='store_true')
+    parser.add_argument('--hotspots-diff', help='Compare hotspots against hotspots.json of an earlier profile.', action='store')
+    parser.add_argument('--bisect', help='Find the commit between GOOD and BAD that made the testtool slower.', nargs=2, metavar=('GOOD','BAD'))
+    parser.add_argument('--bisect-repo', help='zlib-ng git checkout to bisect.', action='store')
+    parser.add_argument('--bisect-levels', help='Levels to bisect, Ex: 6 or 1,6', action='store')
+    parser.add_argument('--compare-to', help='Compare results against a stored run id, or "baseline".', action='store')
+    parser.add_argument('--mark-baseline', help='Mark the stored results of this benchmark as baseline.', action='store_true')
+    parser.add_argument('-e','--engine', help='Benchmark engine, "subprocess" runs testtool, "ctypes" calls the library in-process.', choices=['subprocess','ctypes'])
+    parser.add_argument('--engine-lib', help='Shared library used by the ctypes engine.', action='store')
     args = parser.parse_args()
 
     defconfig_path = util.findfile('deflatebench.conf',fatal=False)
@@ -389,11 +1673,27 @@ def main():
     cfgRuns = cfg['Testruns']
     cfgConfig = cfg['Config']
     cfgTuning = cfg['Tuning']
+    cfgTools = cfg['Tools']
     cfgGen = cfg['Testdata_Gen']
     cfgSingle = cfg['Testdata_Single']
     cfgMulti = cfg['Testdata_Multi']
+    cfgSweep = cfg['Testdata_Sweep']
+    cfgCorpus = cfg['Testdata_Corpus']
+    cfgArtifacts = cfg['Testdata_Artifacts']
+    cfgBisect = cfg['Bisect']
+    cfgMatrix = cfg['Matrix']
 
     util.init(cfgConfig, cfgTuning)
+    cache.init(cfgConfig)
+    hashindex.init(cfgConfig)
+    resultsdb.init(cfgConfig)
+    staging.init(cfgConfig)
+    profile.init(cfgConfig)
+    checkpoint.init(cfgConfig)
+    gitbisect.init(cfgBisect, cfgConfig)
+    synth.init(cfgGen)
+    adapters.init(cfgTools)
+    matrix.init(cfgMatrix, cfgRuns)
 
     # Handle commandline parameters
     if args.runs is not None:
@@ -402,37 +1702,113 @@ def main():
     if args.trimworst is not None:
         cfgRuns['trimworst'] = args.trimworst
 
-    if cfgRuns['runs'] <= cfgRuns['trimworst']:
+    if args.adaptive:
+        cfgRuns['adaptive'] = True
+
+    if cfgRuns['adaptive']:
+        # Trimming would make the confidence interval meaningless
+        if cfgRuns['trimworst']:
+            print(f"Note: adaptive mode does not trim results, ignoring 'trimworst={cfgRuns['trimworst']}'.")
+        cfgRuns['trimworst'] = 0
+        if cfgRuns['minruns'] < 2 or cfgRuns['maxruns'] < cfgRuns['minruns']:
+            print(f"Error, adaptive mode needs 'minruns={cfgRuns['minruns']}' of at least 2, and 'maxruns={cfgRuns['maxruns']}' of at least minruns")
+            sys.exit(1)
+    elif cfgRuns['runs'] <= cfgRuns['trimworst']:
         print(f"Error, parameter 'runs={cfgRuns['runs']}' needs to be higher than parameter 'trimworst={cfgRuns['trimworst']}'")
         sys.exit(1)
 
-    if args.single:
-        cfgRuns['testmode'] = 'single'
-        if args.multi or args.gen:
-            print("Error, parameter '--single' conflicts with parameters '--multi' and '--gen'")
-            sys.exit(1)
+    testmodes = [testmode for testmode in ('single', 'multi', 'gen', 'sweep', 'corpus') if getattr(args, testmode)]
+    if len(testmodes) > 1:
+        print(f"Error, parameters {' and '.join(f'--{testmode}' for testmode in testmodes)} conflict, only one testmode can be given")
+        sys.exit(1)
+    if testmodes:
+        cfgRuns['testmode'] = testmodes[0]
 
-    if args.multi:
-        cfgRuns['testmode'] = 'multi'
-        if args.single or args.gen:
-            print("Error, parameter '--multi' conflicts with parameters '--single' and '--gen'")
+    if args.testtool:
+        cfgRuns['testtool'] = args.testtool[0]
+        if len(args.testtool) == 2:
+            cfgRuns['compare_tool'] = args.testtool[1]
+        elif len(args.testtool) > 2:
+            cfgRuns['tools'] = args.testtool
+    elif cfgRuns['tools']:
+        cfgRuns['testtool'] = cfgRuns['tools'][0]
+
+    if args.bisect:
+        cfgBisect['good'], cfgBisect['bad'] = args.bisect
+
+    if args.bisect_repo:
+        cfgBisect['repo'] = args.bisect_repo
+
+    if args.bisect_levels:
+        cfgBisect['levels'] = args.bisect_levels
+
+    if args.engine:
+        cfgConfig['engine'] = args.engine
+
+    if args.engine_lib:
+        cfgConfig['engine_lib'] = args.engine_lib
+
+    # Sweep and corpus mode time single deflate/inflate calls, process startup would drown out small inputs
+    if cfgRuns['testmode'] in ('sweep', 'corpus'):
+        cfgConfig['engine'] = 'ctypes'
+        if cfgRuns['adaptive'] or cfgConfig['parallel_cpus'] or args.cpus:
+            print(f"Error, adaptive and parallel mode are not supported in {cfgRuns['testmode']} mode.")
+            sys.exit(1)
+    if cfgRuns['testmode'] == 'sweep':
+        if not cfgSweep['sizes'] or min(cfgSweep['sizes']) < 1 or cfgSweep['slices'] < 1:
+            print("Error, sweep mode needs a list of 'sizes' of at least 1 byte, and 'slices' of at least 1.")
             sys.exit(1)
 
-    if args.gen:
-        cfgRuns['testmode'] = 'gen'
-        if args.single or args.multi:
-            print("Error, parameter '--gen' conflicts with parameters '--single' and '--multi'")
+    if cfgConfig['engine'] == 'ctypes':
+        if cfgConfig['engine_format'] not in engine.WBITS:
+            print(f"Error, invalid engine_format '{cfgConfig['engine_format']}'. Valid choices are {', '.join(engine.WBITS)}.")
+            sys.exit(1)
+        if cfgConfig['engine_loops'] < 1:
+            print("Error, parameter 'engine_loops' needs to be 1 or higher.")
+            sys.exit(1)
+        if cfgRuns['compare_tool'] or cfgRuns['tools']:
+            print("Error, comparing testtools is not supported by the ctypes engine.")
+            sys.exit(1)
+    else:
+        adapters.validate()
+        # External tools not in the current directory are looked up in PATH, and referred to by full path from here on
+        cfgRuns['testtool'] = adapters.resolve(cfgRuns['testtool'])
+        if cfgRuns['compare_tool']:
+            cfgRuns['compare_tool'] = adapters.resolve(cfgRuns['compare_tool'])
+        cfgRuns['tools'] = [adapters.resolve(tool) for tool in cfgRuns['tools']]
+        for testtool in testtools():
+            if adapters.name(testtool) is None:
+                print(f"Error, no adapter for testtool '{testtool}'. Known tools are {', '.join(cfgTools)}, more can be added under [Tools].")
+                sys.exit(1)
+
+            if not cfgBisect['good'] and not os.path.isfile( os.path.join( os.getcwd(), testtool) ):
+                print(f"Error, unable to find '{testtool}' in current directory{' or PATH' if adapters.external(testtool) else ''}, did you forget to compile?")
+                sys.exit(1)
+
+        # Side by side tools only run the levels they support, other modes need every level
+        unsupported = [level for level in map(str, baselevels()) if not any(level in adapters.levels(tool) for tool in testtools())
+                       or (not cfgRuns['tools'] and not all(level in adapters.levels(tool) for tool in testtools()))]
+        if unsupported:
+            print(f"Error, level(s) {', '.join(unsupported)} are not supported by the testtool(s), see 'levels' and 'strategies' under [Tools].")
             sys.exit(1)
 
-    if args.testtool:
-        cfgRuns['testtool'] = args.testtool
+    if cfgRuns['tools'] and (cfgRuns['compare_tool'] or cfgRuns['adaptive'] or cfgBisect['good']):
+        print("Error, benchmarking tools side by side can not be combined with A/B, adaptive or bisect mode.")
+        sys.exit(1)
 
-    if 'minigzip' not in cfgRuns['testtool'] and 'minideflate' not in cfgRuns['testtool']:
-        print("Error, config file spesifies invalid testtool. Valid choices are 'minigzip' and 'minideflate'.")
+    if cfgRuns['compare_tool'] and cfgRuns['adaptive']:
+        print("Error, adaptive mode is not supported when comparing two testtools.")
         sys.exit(1)
 
-    if not os.path.isfile( os.path.join( os.getcwd(), cfgRuns['testtool']) ):
-        print(f"Error, unable to find '{cfgRuns['testtool']}' in current directory, did you forget to compile?")
+    if args.order:
+        cfgRuns['order'] = args.order
+
+    if cfgRuns['order'] not in ('sequential', 'random', 'latin'):
+        print(f"Error, invalid order '{cfgRuns['order']}'. Valid choices are 'sequential', 'random' and 'latin'.")
+        sys.exit(1)
+
+    if cfgRuns['ab_order'] not in ('alternate', 'random'):
+        print(f"Error, invalid ab_order '{cfgRuns['ab_order']}'. Valid choices are 'alternate' and 'random'.")
         sys.exit(1)
 
     if args.skipdecomp:
@@ -441,6 +1817,137 @@ def main():
     if args.skipverify:
         cfgConfig['skipverify'] = True
 
+    if args.decomp_only:
+        cfgConfig['decomp_only'] = True
+
+    if args.compare_to:
+        cfgConfig['compare_to'] = args.compare_to
+
+    if args.mark_baseline:
+        cfgConfig['mark_baseline'] = True
+
+    if (cfgConfig['compare_to'] or cfgConfig['mark_baseline']) and not cfgConfig['results_db']:
+        print("Error, '--compare-to' and '--mark-baseline' require the 'results_db' setting.")
+        sys.exit(1)
+
+    if args.rusage:
+        cfgConfig['use_rusage'] = True
+
+    if cfgConfig['use_rusage'] and sys.platform == 'win32':
+        print("Error, 'use_rusage' requires wait4, which is unavailable on Windows.")
+        sys.exit(1)
+
+    if cfgConfig['use_rusage'] and cfgConfig['use_perf'] and cfgConfig['perf_events']:
+        print("Error, 'perf_events' are counted by perf stat, which 'use_rusage' replaces. Clear one of them.")
+        sys.exit(1)
+
+    if cfgConfig['use_rusage'] and cfgConfig['start_delay']:
+        print("Error, 'start_delay' is applied by perf stat, which 'use_rusage' replaces. Clear one of them.")
+        sys.exit(1)
+
+    if args.cpus is not None:
+        cfgConfig['parallel_cpus'] = args.cpus
+
+    if cfgConfig['parallel_cpus'] and sys.platform == 'win32':
+        print("Error, parallel mode requires cpu affinity support, which is unavailable on Windows.")
+        sys.exit(1)
+
+    if cfgConfig['parallel_cpus']:
+        util.checkcpus(util.parse_cpulist(cfgConfig['parallel_cpus']), 'parallel_cpus')
+
+    if args.staging:
+        cfgConfig['staging'] = args.staging
+
+    if args.numa_node is not None:
+        cfgConfig['numa_node'] = args.numa_node
+
+    if cfgGen['model'] != 'repeat' and cfgGen['model'] not in synth.MODELS:
+        print(f"Error, invalid gen model '{cfgGen['model']}'. Valid choices are repeat, {', '.join(synth.MODELS)}.")
+        sys.exit(1)
+
+    if cfgConfig['staging'] not in staging.MODES:
+        print(f"Error, invalid staging '{cfgConfig['staging']}'. Valid choices are {', '.join(staging.MODES)}.")
+        sys.exit(1)
+
+    if sys.platform == 'win32' and (cfgConfig['staging'] != 'warm' or cfgConfig['numa_node'] >= 0 or cfgConfig['staging_hugepages']):
+        print("Error, staging control and NUMA binding are unavailable on Windows.")
+        sys.exit(1)
+
+    if cfgConfig['staging_hugepages'] and cfgConfig['engine'] != 'ctypes':
+        print("Error, 'staging_hugepages' backs the ctypes engine's buffers, the testtool allocates its own memory.")
+        sys.exit(1)
+
+    if args.scale is not None:
+        cfgConfig['scale_cpus'] = args.scale
+
+    if cfgConfig['scale_cpus']:
+        if sys.platform == 'win32':
+            print("Error, scaling mode requires cpu affinity support, which is unavailable on Windows.")
+            sys.exit(1)
+        if cfgConfig['parallel_cpus'] or cfgRuns['adaptive'] or cfgRuns['compare_tool'] or cfgRuns['tools']:
+            print("Error, scaling mode can not be combined with parallel, adaptive, A/B or side by side mode.")
+            sys.exit(1)
+        if cfgConfig['engine'] == 'ctypes' or cfgRuns['testmode'] in ('sweep', 'corpus'):
+            print("Error, scaling mode runs the testtool, it is not supported by the ctypes engine or sweep and corpus mode.")
+            sys.exit(1)
+        util.checkcpus(util.parse_cpulist(cfgConfig['scale_cpus']), 'scale_cpus')
+
+    if args.hotspots:
+        cfgConfig['hotspots'] = True
+
+    if args.hotspots_diff:
+        cfgConfig['hotspots'] = True
+        cfgConfig['hotspots_diff'] = args.hotspots_diff
+
+    if cfgConfig['hotspots'] and (sys.platform == 'win32' or cfgConfig['engine'] == 'ctypes' or cfgConfig['scale_cpus']):
+        print("Error, hotspots profiles the testtool with perf record, it is not supported by the ctypes engine, scaling, sweep and corpus mode.")
+        sys.exit(1)
+
+    if cfgBisect['good']:
+        if not cfgBisect['bad'] or not os.path.isdir(os.path.expanduser(cfgBisect['repo'])):
+            print("Error, bisect mode needs a good and a bad revision, and 'repo' pointing to a git checkout.")
+            sys.exit(1)
+        if (cfgConfig['engine'] == 'ctypes' or cfgRuns['compare_tool'] or cfgRuns['adaptive'] or cfgConfig['parallel_cpus']
+                or cfgConfig['scale_cpus'] or cfgConfig['hotspots'] or args.resume):
+            print("Error, bisect mode can not be combined with the ctypes engine, A/B, adaptive, parallel, scaling, hotspots or resume.")
+            sys.exit(1)
+        unknown = [level for level in bisectlevels() if level not in map(str, getlevels())]
+        if unknown:
+            print(f"Error, bisect level(s) {', '.join(unknown)} are not among the benchmarked levels.")
+            sys.exit(1)
+        if cfgBisect['runs'] < 2:
+            print("Error, bisect mode needs 'runs' of at least 2 to compare commits.")
+            sys.exit(1)
+
+    if cfgConfig['decomp_only']:
+        if cfgConfig['skipdecomp'] or cfgConfig['scale_cpus'] or cfgBisect['good'] or cfgRuns['testmode'] in ('sweep', 'corpus'):
+            print("Error, decomp-only mode can not be combined with skipdecomp, scaling, bisect, sweep or corpus mode.")
+            sys.exit(1)
+        if not all(cfgConfig['engine'] == 'ctypes' or adapters.decompresses(tool, streamformat()) for tool in testtools()):
+            print("Error, in decomp-only mode all testtools decompress the same artifacts, and must read the stream format of the first.")
+            sys.exit(1)
+        unknown = [level for level in cfgArtifacts if level not in map(str, getlevels())]
+        if unknown:
+            print(f"Warning: artifact(s) for level(s) {', '.join(unknown)} are not among the benchmarked levels, and are ignored.")
+
+    if matrix.active():
+        matrix.validate()
+        if cfgConfig['engine'] == 'ctypes' or cfgRuns['testmode'] in ('sweep', 'corpus'):
+            print("Error, the parameter matrix is passed to the testtool, it is not supported by the ctypes engine or sweep and corpus mode.")
+            sys.exit(1)
+        unsupported = [tool for tool in testtools() if not adapters.takesparams(tool)]
+        if unsupported:
+            print(f"Error, the adapter commands of {', '.join(unsupported)} lack {{params}}, the parameter matrix needs a testtool like minideflate.")
+            sys.exit(1)
+
+    if args.resume and (not cfgConfig['checkpoint'] or cfgConfig['scale_cpus'] or cfgRuns['testmode'] in ('sweep', 'corpus')):
+        print("Error, '--resume' requires the 'checkpoint' setting, and is not supported in scaling, sweep and corpus mode.")
+        sys.exit(1)
+
     # Run main benchmarking function
-    benchmain()
+    try:
+        benchmain(args.resume)
+    except KeyboardInterrupt:
+        print("\nInterrupted, use '--resume' to continue the benchmark.")
+        sys.exit(1)
 main()
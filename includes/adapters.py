@@ -0,0 +1,90 @@
+""" adapters.py -- Registry of testtool adapters, describing how each compressor is run and verified.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import shutil
+
+from includes import util
+
+FORMATS = ('gzip', 'zlib', 'raw')
+VERIFY = ('zlib', 'roundtrip', 'none')
+
+# Settings an adapter may leave out
+DEFAULTS = {'levels': '0-9',
+            'strategies': '',
+            'format': 'gzip',
+            'verify': 'zlib',
+            'external': False }
+
+def init(inTools):
+    ''' Initialize variables, filling in defaults of adapters that leave settings out '''
+    global cfgTools
+    cfgTools = inTools
+    for name, adapter in cfgTools.items():
+        for key, value in DEFAULTS.items():
+            adapter.setdefault(key, value)
+
+def validate():
+    ''' Check that every adapter has commands, and a known format and verification method '''
+    for name, adapter in cfgTools.items():
+        if not adapter.get('compress') or not adapter.get('decompress'):
+            print(f"Error, tool adapter '{name}' needs both a 'compress' and a 'decompress' command.")
+            sys.exit(1)
+        if adapter['format'] not in FORMATS:
+            print(f"Error, tool adapter '{name}' has invalid format '{adapter['format']}'. Valid choices are {', '.join(FORMATS)}.")
+            sys.exit(1)
+        if adapter['verify'] not in VERIFY:
+            print(f"Error, tool adapter '{name}' has invalid verify '{adapter['verify']}'. Valid choices are {', '.join(VERIFY)}.")
+            sys.exit(1)
+        if not isinstance(adapter['external'], bool):
+            print(f"Error, tool adapter '{name}' has invalid external '{adapter['external']}', it needs to be true or false.")
+            sys.exit(1)
+
+def name(tool):
+    ''' Return name of the adapter for tool, the longest adapter name contained in its filename '''
+    matches = [name for name in cfgTools if name in os.path.basename(tool)]
+    return max(matches, key=len) if matches else None
+
+def find(tool):
+    ''' Return adapter for tool '''
+    return cfgTools[name(tool)]
+
+def external(tool):
+    ''' Check if tool is an external tool, which may be found in PATH '''
+    return name(tool) is not None and find(tool)['external']
+
+def resolve(tool):
+    ''' Return path of tool, looking in the current directory first and then in PATH for external tools.
+        Other tools are built locally, a system copy must not silently be benchmarked instead '''
+    if os.path.isfile(os.path.join(os.getcwd(), tool)) or not external(tool):
+        return tool
+    return shutil.which(tool) or tool
+
+def levels(tool):
+    ''' Return the level strings supported by tool '''
+    adapter = find(tool)
+    return set(map(str, util.parse_cpulist(adapter['levels']))) | set(adapter['strategies'])
+
+def compcommand(tool, level, filename, params=''):
+    ''' Return command compressing filename to stdout, params are extra options of a parameter matrix '''
+    return find(tool)['compress'].format(tool=os.path.realpath(tool), level=level, input=filename, params=params)
+
+def decompcommand(tool, filename, wbits, params=''):
+    ''' Return command decompressing filename to stdout, wbits is only used by tools able to read several formats '''
+    return find(tool)['decompress'].format(tool=os.path.realpath(tool), input=filename, wbits=wbits, params=params)
+
+def takesparams(tool):
+    ''' Check if the commands of tool accept the options of a parameter matrix '''
+    adapter = find(tool)
+    return '{params}' in adapter['compress'] and '{params}' in adapter['decompress']
+
+def decompresses(tool, fmt):
+    ''' Check if tool can decompress streams of the given format '''
+    adapter = find(tool)
+    return fmt == adapter['format'] or '{wbits}' in adapter['decompress']
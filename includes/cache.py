@@ -0,0 +1,131 @@
+""" cache.py -- Persistent cache of generated testfiles and compressed artifacts.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import json
+import time
+import hashlib
+
+from includes import engine
+from includes import hashindex
+from includes import util
+
+# Cache entries used by this invocation, these are never evicted
+pinned = set()
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig, cachedir, indexfile
+    cfgConfig = inConfig
+    cachedir = os.path.join(cfgConfig['temp_path'], 'deflatebench-cache')
+    indexfile = os.path.join(cachedir, 'index.json')
+
+def loadindex():
+    ''' Load cache index, an unreadable index is treated as empty '''
+    try:
+        with open(indexfile) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = dict()
+    index.setdefault('files', dict())
+    return index
+
+def saveindex(index):
+    ''' Atomically write cache index '''
+    tmpfile = f"{indexfile}.tmp"
+    with open(tmpfile, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmpfile, indexfile)
+
+def evict(index):
+    ''' Remove least recently used files until the cache fits in its budget '''
+    budget = cfgConfig['gen_cache_mib']*1024*1024
+    for key, entry in list(index['files'].items()):
+        if not os.path.isfile(entry['filename']):
+            del index['files'][key]
+
+    used = sum(entry['size'] for entry in index['files'].values())
+    for key, entry in sorted(index['files'].items(), key=lambda item: item[1]['lastused']):
+        if used <= budget:
+            break
+        if key in pinned:
+            continue
+        os.unlink(entry['filename'])
+        used -= entry['size']
+        del index['files'][key]
+
+def testfile(srcfile, minsize):
+    ''' Return filename, hash and size of testfile generated from srcfile, generating it on cache miss '''
+    os.makedirs(cachedir, exist_ok=True)
+    index = loadindex()
+
+    srchash = hashindex.hashfile(srcfile)
+    key = hashlib.sha1(f"{srchash}:{minsize}".encode()).hexdigest()
+    entry = index['files'].get(key)
+
+    if entry is None or not os.path.isfile(entry['filename']) or os.path.getsize(entry['filename']) != entry['size']:
+        filename = os.path.join(cachedir, f"gen-{key}.tmp")
+        genhash, gensize = util.generate_testfile(srcfile, filename, minsize)
+        entry = {'filename': filename,
+                 'hash': genhash,
+                 'size': gensize,
+                 'source': srcfile,
+                 'minsize': minsize}
+        index['files'][key] = entry
+
+    return use(index, key, entry)
+
+def synthetic(settings, srcfile, size, generate):
+    ''' Return filename, hash and size of synthetic testdata, calling generate(filename) on cache miss.
+        settings are the model settings the data depends on, srcfile is the trained on source file or None '''
+    os.makedirs(cachedir, exist_ok=True)
+    index = loadindex()
+
+    srchash = hashindex.hashfile(srcfile) if srcfile else ''
+    key = hashlib.sha1(f"synth:{json.dumps(settings, sort_keys=True)}:{srchash}:{size}".encode()).hexdigest()
+    entry = index['files'].get(key)
+
+    if entry is None or not os.path.isfile(entry['filename']) or os.path.getsize(entry['filename']) != entry['size']:
+        filename = os.path.join(cachedir, f"synth-{key}.tmp")
+        genhash, gensize = generate(filename)
+        entry = {'filename': filename,
+                 'hash': genhash,
+                 'size': gensize,
+                 'source': srcfile,
+                 'model': settings['model']}
+        index['files'][key] = entry
+
+    return use(index, key, entry)
+
+def artifact(toolhash, level, inputhash, fmt, compress):
+    ''' Return filename and size of the stream compressed from a testfile by a tool, calling compress(filename) on cache miss '''
+    os.makedirs(cachedir, exist_ok=True)
+    index = loadindex()
+
+    key = hashlib.sha1(f"artifact:{toolhash}:{level}:{inputhash}:{fmt}".encode()).hexdigest()
+    entry = index['files'].get(key)
+
+    if entry is None or not os.path.isfile(entry['filename']) or os.path.getsize(entry['filename']) != entry['size']:
+        filename = os.path.join(cachedir, f"artifact-{key}.{engine.EXTENSIONS[fmt]}")
+        compress(filename)
+        entry = {'filename': filename,
+                 'size': os.path.getsize(filename),
+                 'level': level,
+                 'format': fmt}
+        index['files'][key] = entry
+
+    filename, _, size = use(index, key, entry)
+    return filename, size
+
+def use(index, key, entry):
+    ''' Mark entry as used by this invocation and save the index, returns its filename, hash and size '''
+    entry['lastused'] = time.time()
+    pinned.add(key)
+    evict(index)
+    saveindex(index)
+    return entry['filename'], entry.get('hash'), entry['size']
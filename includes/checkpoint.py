@@ -0,0 +1,120 @@
+""" checkpoint.py -- Checkpoint file of collected samples, allowing an interrupted benchmark to be resumed.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, the checkpoint is not locked
+
+# Settings that do not affect the samples, and may change when resuming
+VOLATILE = ('checkpoint', 'compare_to', 'mark_baseline')
+
+checkfile = None
+done = dict()
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig, filename
+    cfgConfig = inConfig
+    filename = os.path.expanduser(cfgConfig['checkpoint']) if cfgConfig['checkpoint'] else None
+
+def identity(cfgRuns, tools, tempfiles, staging):
+    ''' Return everything that must be unchanged for samples to be resumed, normalized through json '''
+    ident = {'Testruns': cfgRuns,
+             'Config': {key: value for key, value in cfgConfig.items() if key not in VOLATILE},
+             'tools': tools,
+             'testdata': {level: tempfiles[level]['hash'] for level in tempfiles},
+             'staging': staging}
+    return json.loads(json.dumps(ident, default=str))
+
+def jobkey(job):
+    ''' Return string key of a (run, level, tool) job '''
+    return json.dumps(list(job))
+
+def lock(f):
+    ''' Take an exclusive lock on the open checkpoint, returns False if another benchmark holds it '''
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def start(ident, resume=False):
+    ''' Open and lock checkpoint, loading the samples of finished jobs when resuming a matching checkpoint '''
+    global checkfile
+    if resume and not os.path.isfile(filename):
+        print(f"Error, no checkpoint to resume in '{filename}'.")
+        sys.exit(1)
+
+    # Locked before it is read or truncated, so concurrent benchmarks can not clobber each other's samples
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    f = open(filename, 'a+')
+    if not lock(f):
+        f.close()
+        print(f"Error, checkpoint '{filename}' is in use by another benchmark, point 'checkpoint' at another file.")
+        sys.exit(1)
+
+    if resume:
+        f.seek(0)
+        lines = f.readlines()
+        if not lines or json.loads(lines[0]).get('identity') != ident:
+            print(f"Error, checkpoint '{filename}' was made with a different config, tools or testdata, unable to resume.")
+            sys.exit(1)
+        for line in lines[1:]:
+            # A line cut short by the interruption is simply run again
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[jobkey(entry['job'])] = entry['sample']
+        # Rewrite without any partial line, so appending continues cleanly
+        lines = lines[:1] + [json.dumps({'job': json.loads(key), 'sample': sample}) + '\n' for key, sample in done.items()]
+    else:
+        lines = [json.dumps({'identity': ident}) + '\n']
+
+    checkfile = f
+    checkfile.truncate(0)
+    checkfile.writelines(lines)
+    checkfile.flush()
+    return len(done)
+
+def lookup(job):
+    ''' Return sample of job if it was finished before resuming, else None '''
+    return done.get(jobkey(job))
+
+def append(job, sample):
+    ''' Append sample of a finished job, flushed so it survives the benchmark being killed '''
+    if checkfile is None:
+        return
+    checkfile.write(json.dumps({'job': list(job), 'sample': sample}) + '\n')
+    checkfile.flush()
+
+def sync():
+    ''' Sync appended samples to disk, so they also survive a system crash. Not done per sample, as syncing
+        disturbs measurements still running. Samples appended since the last sync are lost in a system crash '''
+    if checkfile is None:
+        return
+    os.fsync(checkfile.fileno())
+
+def finish(completed):
+    ''' Close checkpoint, it is removed once the benchmark completed '''
+    global checkfile
+    if checkfile is None:
+        return
+    if completed:
+        os.unlink(filename)
+    else:
+        sync()
+    checkfile.close()
+    checkfile = None
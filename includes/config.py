@@ -16,14 +16,50 @@ def defconfig():
                             'minlevel': 0,
                             'maxlevel': 9,
                             'strategies': '', # fhRF
-                            'testmode': 'single',  # generate / multi / single
-                            'testtool': 'minigzip' } # minigzip / minideflate
+                            'testmode': 'single',  # generate / multi / single / sweep / corpus
+                            'testtool': 'minigzip', # Any tool with an adapter under [Tools], ex: minigzip / minideflate
+                            'tools': [],         # Testtools benchmarked side by side, ex: ['minigzip', '/usr/bin/libdeflate-gzip', 'pigz']
+                            'adaptive': False,  # Run each level until its results are stable, instead of a fixed number of runs
+                            'minruns': 5,       # Adaptive: minimum runs per level
+                            'maxruns': 50,      # Adaptive: maximum runs per level
+                            'ci_width': 0.01,   # Adaptive: target width of confidence interval, relative to the mean
+                            'confidence': 0.95,  # Confidence level used for confidence intervals and significance tests
+                            'compare_tool': '',  # Second testtool to compare against testtool (A/B mode)
+                            'ab_order': 'alternate', # A/B mode: alternate / random order of A and B runs per level
+                            'order': 'sequential',  # sequential / random / latin. Order of levels within each run
+                            'drift_r': 0.5,      # Warn about drift when sample times correlate this strongly with order or cpu frequency
+                            'seed': 0 }          # Seed for randomized ordering and bootstrapping
 
     config['Config'] = {'temp_path': tempfile.gettempdir(),
                         'use_perf': True,
+                        'use_rusage': False,  # Run testtool directly and measure with wait4 rusage, overrides use_perf
                         'start_delay': 0,   # Milliseconds of startup to skip measuring, requires usleep(X*1000) in minigzip/minideflate main()
+                        'perf_events': '',  # Extra perf counters to collect. Ex: 'cycles:u,instructions:u,branch-misses:u,cache-misses:u,L1-dcache-load-misses:u'
+                        'staging': 'warm',  # warm / willneed / populate / cold. Page cache state of the input before each measurement
+                        'staging_require_tmpfs': False,  # Fail instead of warn if temp_path is not on tmpfs/ramfs
+                        'staging_hugepages': False,  # Back the ctypes engine's buffers with transparent hugepages
+                        'numa_node': -1,    # Bind memory and cpus to this NUMA node, -1 to disable
                         'skipverify': False,
-                        'skipdecomp': False}
+                        'skipdecomp': False,
+                        'decomp_only': False,  # Compress each level once, cached in temp_path, and only measure decompression
+                        'parallel_cpus': '',  # Ex: '2,3,6-7'. Runs jobs in parallel, each pinned to one of these (isolated) cpus
+                        'scale_cpus': '',  # Ex: '0-7'. Runs 1, 2, 4 .. N concurrent instances per level, each pinned to one of these cpus
+                        'engine': 'subprocess',  # subprocess / ctypes
+                        'engine_lib': 'libz-ng.so', # Shared library used by the ctypes engine
+                        'engine_format': 'gzip',  # gzip / zlib / raw
+                        'engine_loops': 1,  # Deflate/inflate calls per run, times are reported per call
+                        'hotspots': False,  # Profile each level with perf record after benchmarking
+                        'hotspots_top': 10, # Number of functions listed per level and phase
+                        'hotspots_freq': 4999,  # perf record sampling frequency in Hz
+                        'hotspots_dir': 'deflatebench-hotspots',  # Folded stacks and hotspots.json are written here
+                        'hotspots_diff': '',  # hotspots.json of an earlier profile to compare against
+                        'gen_cache': True,  # Keep generated testfiles in temp_path between invocations
+                        'gen_cache_mib': 2048,  # Size budget of the generated testfile cache, least recently used files are evicted
+                        'hash_index': '~/.cache/deflatebench/hashindex.json',  # Remembers testdata hashes between invocations, '' to disable
+                        'checkpoint': '~/.cache/deflatebench/checkpoint.jsonl',  # Samples are saved here as they are collected, for --resume. '' to disable
+                        'results_db': '~/.local/share/deflatebench/results.db',  # SQLite database storing all results, '' to disable
+                        'compare_to': '',   # Stored run id or 'baseline' to check for regressions against
+                        'mark_baseline': False}  # Mark the stored results as the new baseline
 
     ## CPU related settings
     config['Tuning'] = {'use_chrt': False,
@@ -34,9 +70,73 @@ def defconfig():
                         'cpu_std_maxspeed': 2200,
                         'cpu_bench_speed': 2000 }
 
+    # Testtool adapters, a testtool uses the adapter with the longest name contained in its filename
+    # Commands replace {tool}, {level} and {input}, decompress commands may take {wbits} to read other stream formats
+    # {params} takes the options of the parameter matrix, only minideflate supports them
+    # verify: zlib (python zlib and roundtrip) / roundtrip (hash of decompressed output) / none
+    config['Tools'] = { 'minigzip': {'compress': '{tool} -{level} -c {input}',
+                                     'decompress': '{tool} -d -c {input}',
+                                     'levels': '0-9',
+                                     'strategies': 'fhRF',
+                                     'format': 'gzip',
+                                     'verify': 'zlib' },
+                        'minideflate': {'compress': '{tool} -{level} {params} -c {input}',
+                                        'decompress': '{tool} -d -w {wbits} {params} -c {input}',
+                                        'levels': '0-9',
+                                        'strategies': 'fhRF',
+                                        'format': 'zlib',
+                                        'verify': 'zlib' },
+                        'gzip': {'compress': '{tool} -{level} -c {input}',
+                                 'decompress': '{tool} -d -c {input}',
+                                 'levels': '1-9',
+                                 'format': 'gzip',
+                                 'verify': 'zlib',
+                                 'external': True },  # Looked up in PATH when not in the current directory
+                        'libdeflate-gzip': {'compress': '{tool} -{level} -c {input}',
+                                            'decompress': '{tool} -d -c {input}',
+                                            'levels': '1-12',
+                                            'format': 'gzip',
+                                            'verify': 'zlib',
+                                            'external': True },
+                        'igzip': {'compress': '{tool} -{level} -c {input}',
+                                  'decompress': '{tool} -d -c {input}',
+                                  'levels': '0-3',
+                                  'format': 'gzip',
+                                  'verify': 'zlib',
+                                  'external': True },
+                        'pigz': {'compress': '{tool} -p 1 -{level} -c {input}',  # Single threaded, cputime is compared
+                                 'decompress': '{tool} -p 1 -d -c {input}',
+                                 'levels': '0-9,11',
+                                 'format': 'gzip',
+                                 'verify': 'zlib',
+                                 'external': True }}
+
+    # Parameter matrix, every level is benchmarked with each combination of the listed values. Empty lists are left at default
+    config['Matrix'] = {'window_bits': [],  # Ex: [10, 12, 15]. Window size, the stream format is kept
+                        'mem_level': [],    # Ex: [6, 8, 9]
+                        'read_size': [],    # Ex: [16384, 65536]. Input buffer size of the testtool
+                        'write_size': [],   # Ex: [16384, 65536]. Output buffer size of the testtool
+                        'samples': 0 }      # Benchmark this many randomly chosen combinations per level, 0 for all
+
+    # Bisect performance regressions in a zlib-ng checkout
+    config['Bisect'] = {'repo': '',         # Path to zlib-ng git checkout
+                        'good': '',         # Revision with good performance
+                        'bad': '',          # Revision with bad performance
+                        'build': 'cmake -S {src} -B {build} -DCMAKE_BUILD_TYPE=Release -DZLIB_ENABLE_TESTS=ON && cmake --build {build} -j',
+                        'levels': '',       # Levels to bisect, Ex: '6' or '1,6'. Empty for all levels
+                        'runs': 5,          # Runs per level for each tested commit
+                        'cache': '~/.cache/deflatebench/builds' }  # Built testtools are cached here per commit and build command
+
     # Single testfile
     config['Testdata_Single'] = { 'testfile': 'silesia.tar' }
 
+    # Input size sweep, slices the single testfile
+    config['Testdata_Sweep'] = {'sizes': [1024, 4096, 16384, 65536, 262144],  # Slice sizes in bytes
+                                'slices': 64 }  # Slices per size, spread evenly over the testfile
+
+    # Corpus of testfiles, each file is benchmarked and reported separately
+    config['Testdata_Corpus'] = {'path': 'silesia.tar' }  # Directory or tar archive
+
     # Multiple testfiles
     config['Testdata_Multi'] = {'0': 'testfile-500M',
                                 '1': 'testfile-300M',
@@ -49,8 +149,19 @@ def defconfig():
                                 '8': 'testfile-20M',
                                 '9': 'testfile-20M' }
 
+    # Externally compressed artifacts per level, decompressed instead of compressing the testfile in decomp-only mode
+    # Format is given by the extension: .gz (gzip), .zz (zlib) or .raw (raw deflate). Ex: '9': 'silesia-libdeflate-12.gz'
+    config['Testdata_Artifacts'] = dict()
+
     # Generated testfiles
     config['Testdata_Gen'] =  { 'srcFile': 'silesia-small.tar',
+                                'model': 'repeat',  # Generator: repeat srcFile, or synthetic entropy, lz, markov or shuffle (needs numpy)
+                                'seed': 0,  # Seed of the synthetic models, same seed and settings give identical data
+                                'entropy': 6.0,  # Bits per byte of literals for the entropy and lz models
+                                'literal_len': 8,  # Mean length of literal runs for the lz model
+                                'match_len': 16,  # Mean match length for the lz model
+                                'match_dist': 4096,  # Mean match distance for the lz model
+                                'block_size': 4096,  # Size of blocks sampled from srcFile for the shuffle model
                                 '0': 500,
                                 '1': 270,
                                 '2': 135,
@@ -82,10 +193,23 @@ def mergeconfig(src, chg):
         src['Config'].update(chg['Config'])
     if 'Tuning' in chg:
         src['Tuning'].update(chg['Tuning'])
+    if 'Bisect' in chg:
+        src['Bisect'].update(chg['Bisect'])
+    if 'Matrix' in chg:
+        src['Matrix'].update(chg['Matrix'])
+    if 'Tools' in chg:
+        for name, adapter in chg['Tools'].items():
+            src['Tools'].setdefault(name, dict()).update(adapter)
     if 'Testdata_Gen' in chg:
         src['Testdata_Gen'].update(chg['Testdata_Gen'])
     if 'Testdata_Single' in chg:
         src['Testdata_Single'].update(chg['Testdata_Single'])
     if 'Testdata_Multi' in chg:
         src['Testdata_Multi'].update(chg['Testdata_Multi'])
+    if 'Testdata_Sweep' in chg:
+        src['Testdata_Sweep'].update(chg['Testdata_Sweep'])
+    if 'Testdata_Corpus' in chg:
+        src['Testdata_Corpus'].update(chg['Testdata_Corpus'])
+    if 'Testdata_Artifacts' in chg:
+        src['Testdata_Artifacts'].update(chg['Testdata_Artifacts'])
     return src
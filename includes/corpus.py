@@ -0,0 +1,76 @@
+""" corpus.py -- Helperfunctions for loading a corpus of testfiles and sorting them into content classes.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import tarfile
+
+# Leading bytes identifying already compressed or otherwise well-known formats
+MAGIC = [(b'\x1f\x8b', 'compressed'),     # gzip
+         (b'PK\x03\x04', 'compressed'),   # zip
+         (b'BZh', 'compressed'),          # bzip2
+         (b'\xfd7zXZ\x00', 'compressed'), # xz
+         (b'\x28\xb5\x2f\xfd', 'compressed'), # zstd
+         (b'\x89PNG', 'image'),
+         (b'\xff\xd8\xff', 'image'),      # jpeg
+         (b'GIF8', 'image'),
+         (b'%PDF', 'document'),
+         (b'\x7fELF', 'executable'),
+         (b'MZ', 'executable') ]
+
+SNIFF_SIZE = 4096
+TEXT_BYTES = frozenset([9, 10, 12, 13] + list(range(32, 127)))
+
+def classify(data):
+    ''' Guess content class of a file from its first bytes '''
+    sample = bytes(data[:SNIFF_SIZE])
+    for magic, contentclass in MAGIC:
+        if sample.startswith(magic):
+            return contentclass
+
+    # Treat utf-8 as text, a few odd bytes are allowed in otherwise printable data
+    if b'\x00' not in sample:
+        printable = sum(1 for byte in sample if byte in TEXT_BYTES or byte >= 128)
+        if sample and printable >= len(sample) * 0.95:
+            return 'xml' if sample.lstrip().startswith(b'<') else 'text'
+    return 'binary'
+
+def members(path):
+    ''' Yield (name, data) of every non-empty file in a directory or tar archive, in stable order '''
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                fullname = os.path.join(root, filename)
+                if os.path.isfile(fullname) and os.path.getsize(fullname):
+                    with open(fullname, 'rb') as f:
+                        yield os.path.relpath(fullname, path), f.read()
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if member.isfile() and member.size:
+                    yield member.name, tar.extractfile(member).read()
+    else:
+        print(f"Error, corpus '{path}' is neither a directory nor a tar archive.")
+        sys.exit(1)
+
+def load(path):
+    ''' Read all corpus files back to back into one buffer, returns the buffer and a list of dicts describing each file '''
+    buf = bytearray()
+    files = []
+    for name, data in members(path):
+        files.append({'name': name,
+                      'offset': len(buf),
+                      'size': len(data),
+                      'class': classify(data)})
+        buf += data
+
+    if not files:
+        print(f"Error, corpus '{path}' contains no files.")
+        sys.exit(1)
+    return buf, files
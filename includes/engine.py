@@ -0,0 +1,192 @@
+""" engine.py -- In-process deflate/inflate engine calling libz-ng/libz through ctypes.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import ctypes
+import mmap
+import sys
+import time
+
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BUF_ERROR = -5
+Z_NO_FLUSH = 0
+Z_FINISH = 4
+Z_DEFLATED = 8
+Z_DEFAULT_COMPRESSION = -1
+Z_DEFAULT_STRATEGY = 0
+
+# Strategy flags as accepted by minigzip/minideflate
+STRATEGIES = {'f': 1,   # Z_FILTERED
+              'h': 2,   # Z_HUFFMAN_ONLY
+              'R': 3,   # Z_RLE
+              'F': 4 }  # Z_FIXED
+
+# windowBits for each stream format
+WBITS = {'gzip': 31,
+         'zlib': 15,
+         'raw': -15 }
+
+# File extensions of compressed streams
+EXTENSIONS = {'gzip': 'gz',
+              'zlib': 'zz',
+              'raw': 'raw' }
+
+MAX_CHUNK = 1 << 30  # avail_in/avail_out are 32-bit, feed large buffers in chunks
+
+class ZStream(ctypes.Structure):
+    ''' z_stream as defined by zlib and zlib-ng in compat mode '''
+    _fields_ = [('next_in', ctypes.c_void_p),
+                ('avail_in', ctypes.c_uint),
+                ('total_in', ctypes.c_ulong),
+                ('next_out', ctypes.c_void_p),
+                ('avail_out', ctypes.c_uint),
+                ('total_out', ctypes.c_ulong),
+                ('msg', ctypes.c_char_p),
+                ('state', ctypes.c_void_p),
+                ('zalloc', ctypes.c_void_p),
+                ('zfree', ctypes.c_void_p),
+                ('opaque', ctypes.c_void_p),
+                ('data_type', ctypes.c_int),
+                ('adler', ctypes.c_ulong),
+                ('reserved', ctypes.c_ulong)]
+
+class ZngStream(ctypes.Structure):
+    ''' zng_stream as defined by zlib-ng in native mode '''
+    _fields_ = [('next_in', ctypes.c_void_p),
+                ('avail_in', ctypes.c_uint32),
+                ('total_in', ctypes.c_size_t),
+                ('next_out', ctypes.c_void_p),
+                ('avail_out', ctypes.c_uint32),
+                ('total_out', ctypes.c_size_t),
+                ('msg', ctypes.c_char_p),
+                ('state', ctypes.c_void_p),
+                ('zalloc', ctypes.c_void_p),
+                ('zfree', ctypes.c_void_p),
+                ('opaque', ctypes.c_void_p),
+                ('data_type', ctypes.c_int),
+                ('adler', ctypes.c_uint32),
+                ('reserved', ctypes.c_ulong)]
+
+def load(libpath):
+    ''' Load shared library and resolve the deflate/inflate api, native zlib-ng api preferred '''
+    global lib, api, loadedpath
+    loadedpath = libpath
+    try:
+        lib = ctypes.CDLL(libpath)
+    except OSError as e:
+        print(f"Error: Unable to load compression library '{libpath}': {e}")
+        sys.exit(1)
+
+    api = dict()
+    if hasattr(lib, 'zng_deflateInit2'):
+        api['native'] = True
+        api['stream'] = ZngStream
+        api['deflateInit2'] = lib.zng_deflateInit2
+        api['inflateInit2'] = lib.zng_inflateInit2
+        api['deflate'], api['deflateEnd'] = lib.zng_deflate, lib.zng_deflateEnd
+        api['inflate'], api['inflateEnd'] = lib.zng_inflate, lib.zng_inflateEnd
+        api['deflateBound'] = lib.zng_deflateBound
+        api['deflateBound'].restype = ctypes.c_size_t
+        api['deflateBound'].argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        lib.zlibng_version.restype = ctypes.c_char_p
+        api['version'] = lib.zlibng_version().decode()
+    else:
+        api['native'] = False
+        api['stream'] = ZStream
+        api['deflateInit2'] = lib.deflateInit2_
+        api['inflateInit2'] = lib.inflateInit2_
+        api['deflate'], api['deflateEnd'] = lib.deflate, lib.deflateEnd
+        api['inflate'], api['inflateEnd'] = lib.inflate, lib.inflateEnd
+        api['deflateBound'] = lib.deflateBound
+        api['deflateBound'].restype = ctypes.c_ulong
+        api['deflateBound'].argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        lib.zlibVersion.restype = ctypes.c_char_p
+        api['version'] = lib.zlibVersion().decode()
+    return api['version']
+
+def version():
+    ''' Return version string of loaded library '''
+    return api['version']
+
+def parselevel(level):
+    ''' Convert level string to (level, strategy) pair, strategies use the default level like minigzip does '''
+    if level in STRATEGIES:
+        return Z_DEFAULT_COMPRESSION, STRATEGIES[level]
+    return int(level), Z_DEFAULT_STRATEGY
+
+def buffer(size, hugepages=False):
+    ''' Allocate a ctypes buffer, or an anonymous mapping backed by transparent hugepages '''
+    if hugepages:
+        buf = mmap.mmap(-1, max(size, 1))
+        if hasattr(mmap, 'MADV_HUGEPAGE'):
+            buf.madvise(mmap.MADV_HUGEPAGE)
+        return buf
+    return ctypes.create_string_buffer(max(size, 1))
+
+def address(buf, offset=0):
+    ''' Return memory address of writable buffer (ctypes array, bytearray or mmap) '''
+    if isinstance(buf, ctypes.Array):
+        return ctypes.addressof(buf) + offset
+    return ctypes.addressof(ctypes.c_char.from_buffer(buf, offset))
+
+def bound(srclen):
+    ''' Return worst case compressed size '''
+    # Leave room for the gzip header/trailer, deflateBound without a stream assumes zlib wrapper
+    return api['deflateBound'](None, srclen) + 32
+
+def _init(func, strm, *args):
+    ''' Call an init function, the zlib api takes version and stream size as extra arguments '''
+    args = [ctypes.c_int(arg) for arg in args]
+    if not api['native']:
+        args += [ctypes.c_char_p(api['version'].encode()), ctypes.c_int(ctypes.sizeof(strm))]
+    return func(ctypes.byref(strm), *args)
+
+def _stream(func, strm, src, srclen, dst, dstlen):
+    ''' Feed src through deflate/inflate into dst in 32-bit sized chunks '''
+    ret = Z_OK
+    remain_in, remain_out = srclen, dstlen
+    strm.next_in, strm.next_out = src, dst
+    while ret == Z_OK:
+        if strm.avail_in == 0 and remain_in:
+            strm.avail_in = min(remain_in, MAX_CHUNK)
+            remain_in -= strm.avail_in
+        if strm.avail_out == 0 and remain_out:
+            strm.avail_out = min(remain_out, MAX_CHUNK)
+            remain_out -= strm.avail_out
+        ret = func(ctypes.byref(strm), Z_FINISH if not remain_in else Z_NO_FLUSH)
+        if ret == Z_BUF_ERROR and (remain_in or remain_out):
+            ret = Z_OK
+    return ret
+
+def deflate(src, srclen, dst, dstlen, level, strategy=Z_DEFAULT_STRATEGY, wbits=31, memlevel=8):
+    ''' Compress srclen bytes at address src into dst, returns compressed size and cpu time of the call '''
+    strm = api['stream']()
+    starttime = time.thread_time()
+    ret = _init(api['deflateInit2'], strm, level, Z_DEFLATED, wbits, memlevel, strategy)
+    if ret == Z_OK:
+        ret = _stream(api['deflate'], strm, src, srclen, dst, dstlen)
+        api['deflateEnd'](ctypes.byref(strm))
+    cputime = time.thread_time() - starttime
+
+    if ret != Z_STREAM_END:
+        sys.exit(f"Failed, deflate returned {ret}")
+    return strm.total_out, cputime
+
+def inflate(src, srclen, dst, dstlen, wbits=31):
+    ''' Decompress srclen bytes at address src into dst, returns decompressed size and cpu time of the call '''
+    strm = api['stream']()
+    starttime = time.thread_time()
+    ret = _init(api['inflateInit2'], strm, wbits)
+    if ret == Z_OK:
+        ret = _stream(api['inflate'], strm, src, srclen, dst, dstlen)
+        api['inflateEnd'](ctypes.byref(strm))
+    cputime = time.thread_time() - starttime
+
+    if ret != Z_STREAM_END:
+        sys.exit(f"Failed, inflate returned {ret}")
+    return strm.total_out, cputime
@@ -0,0 +1,93 @@
+""" gitbisect.py -- Helperfunctions for building testtools from a git checkout, cached per commit.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import shlex
+import shutil
+import subprocess
+import tempfile
+import hashlib
+
+def init(inBisect, inConfig):
+    ''' Initialize variables '''
+    global cfgBisect, cfgConfig, cachedir
+    cfgBisect = inBisect
+    cfgConfig = inConfig
+    cachedir = os.path.expanduser(cfgBisect['cache'])
+
+def git(*args):
+    ''' Run git in the bisect repository, returns its output '''
+    proc = subprocess.run(['git', '-C', os.path.expanduser(cfgBisect['repo'])] + list(args),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        print(f"Error, git {' '.join(args)} failed: {proc.stderr.strip()}")
+        sys.exit(1)
+    return proc.stdout.strip()
+
+def resolve(revision):
+    ''' Return full commit hash of revision '''
+    return git('rev-parse', '--verify', f"{revision}^{{commit}}")
+
+def commits(good, bad):
+    ''' Return commits after good up to and including bad, oldest first, following first parents '''
+    return git('rev-list', '--first-parent', '--reverse', f"{good}..{bad}").split()
+
+def subject(commit):
+    ''' Return short hash and subject line of commit '''
+    return git('log', '-1', '--format=%h %s', commit)
+
+def build(commit, tools):
+    ''' Build commit out-of-tree, returns directory holding the built tools, or None if the build failed.
+        Builds are cached per commit and build command, including failed ones '''
+    buildhash = hashlib.sha1(cfgBisect['build'].encode()).hexdigest()[:12]
+    commitdir = os.path.join(cachedir, f"{commit}-{buildhash}")
+    failfile = os.path.join(commitdir, 'failed')
+    if all(os.path.isfile(os.path.join(commitdir, tool)) for tool in tools):
+        return commitdir
+    if os.path.isfile(failfile):
+        return None
+
+    os.makedirs(commitdir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix='deflatebench-build-', dir=cfgConfig['temp_path'])
+    srcdir, builddir = os.path.join(workdir, 'src'), os.path.join(workdir, 'build')
+    os.makedirs(srcdir)
+    os.makedirs(builddir)
+    try:
+        # Export the commit instead of checking it out, leaving the user's checkout alone
+        archive = subprocess.Popen(['git', '-C', os.path.expanduser(cfgBisect['repo']), 'archive', '--format=tar', commit], stdout=subprocess.PIPE)
+        try:
+            subprocess.run(['tar', '-x', '-C', srcdir], stdin=archive.stdout, check=True)
+        except (OSError, subprocess.CalledProcessError) as error:
+            archive.kill()
+            print(f"Error, unable to extract commit {commit} with tar: {error}")
+            sys.exit(1)
+        finally:
+            archive.stdout.close()
+        if archive.wait() != 0:
+            print(f"Error, unable to export commit {commit} with git archive.")
+            sys.exit(1)
+
+        # The directories are under temp_path, quoted as it may contain spaces or shell characters
+        with open(os.path.join(commitdir, 'build.log'), 'w') as log:
+            retval = subprocess.call(cfgBisect['build'].format(src=shlex.quote(srcdir), build=shlex.quote(builddir)), shell=True,
+                                     stdout=log, stderr=subprocess.STDOUT)
+
+        found = dict()
+        for root, dirs, files in os.walk(builddir):
+            for tool in tools:
+                if tool in files and tool not in found:
+                    found[tool] = os.path.join(root, tool)
+        if retval != 0 or len(found) != len(tools):
+            open(failfile, 'w').close()
+            return None
+        for tool, filename in found.items():
+            shutil.copy2(filename, os.path.join(commitdir, tool))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return commitdir
@@ -0,0 +1,65 @@
+""" hashindex.py -- Persistent index of testdata file hashes.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import json
+
+from includes import util
+
+index = None
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig, indexfile
+    cfgConfig = inConfig
+    indexfile = os.path.expanduser(cfgConfig['hash_index']) if cfgConfig['hash_index'] else None
+
+def load():
+    ''' Load index on first use, an unreadable index is treated as empty '''
+    global index
+    if index is None:
+        try:
+            with open(indexfile) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = dict()
+    return index
+
+def save():
+    ''' Atomically write index, dropping entries for files that no longer exist '''
+    for filename in [filename for filename in index if not os.path.isfile(filename)]:
+        del index[filename]
+
+    os.makedirs(os.path.dirname(indexfile), exist_ok=True)
+    tmpfile = f"{indexfile}.tmp"
+    with open(tmpfile, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmpfile, indexfile)
+
+def identity(filename):
+    ''' Return the fields that invalidate an index entry when changed '''
+    st = os.stat(filename)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+def hashfile(filename):
+    ''' Return hash of file, from the index if the file is unchanged since it was last hashed '''
+    if not indexfile:
+        return util.hashfile(filename)
+
+    filename = os.path.realpath(filename)
+    ident = identity(filename)
+    entry = load().get(filename)
+    if entry is not None and all(entry[key] == value for key, value in ident.items()):
+        return entry['hash']
+
+    filehash = util.hashfile(filename)
+    # Only trust the hash if the file did not change while we were hashing it
+    if identity(filename) == ident:
+        index[filename] = dict(ident, hash=filehash)
+        save()
+    return filehash
@@ -0,0 +1,92 @@
+""" matrix.py -- Parameter matrix of window bits, memLevel and buffer sizes benchmarked per level.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import sys
+import random
+import itertools
+
+# Matrix dimensions, with the tag used in level keys. The tags are also the minideflate options setting them
+DIMENSIONS = (('window_bits', 'w'),
+              ('mem_level', 'm'),
+              ('read_size', 'r'),
+              ('write_size', 't'))
+
+# zlib defaults, used when a dimension is not part of the matrix
+DEFAULT_WINDOW_BITS = 15
+DEFAULT_MEM_LEVEL = 8
+
+def init(inMatrix, inRuns):
+    ''' Initialize variables '''
+    global cfgMatrix, cfgRuns
+    cfgMatrix = inMatrix
+    cfgRuns = inRuns
+
+def active():
+    ''' Check if any matrix dimension is configured '''
+    return any(cfgMatrix[name] for name, tag in DIMENSIONS)
+
+def validate():
+    ''' Check that matrix values are within the ranges zlib accepts '''
+    if any(bits not in range(9, 16) for bits in cfgMatrix['window_bits']):
+        print("Error, matrix 'window_bits' must be between 9 and 15, the stream format is given by the testtool.")
+        sys.exit(1)
+    if any(level not in range(1, 10) for level in cfgMatrix['mem_level']):
+        print("Error, matrix 'mem_level' must be between 1 and 9.")
+        sys.exit(1)
+    if any(size < 1 for size in cfgMatrix['read_size'] + cfgMatrix['write_size']):
+        print("Error, matrix 'read_size' and 'write_size' must be at least 1 byte.")
+        sys.exit(1)
+    if cfgMatrix['samples'] < 0:
+        print("Error, matrix 'samples' can not be negative.")
+        sys.exit(1)
+
+def keys(levels):
+    ''' Return level keys of every parameter combination of each level, like "6:w15:m8", or a seeded sample of them '''
+    dimensions = [(tag, cfgMatrix[name]) for name, tag in DIMENSIONS if cfgMatrix[name]]
+    combinations = list(itertools.product(*[values for tag, values in dimensions]))
+    result = []
+    for level in levels:
+        # Seeded per level, so the sample of a level does not depend on which other levels are benchmarked
+        chosen = combinations
+        if 0 < cfgMatrix['samples'] < len(combinations):
+            chosen = sorted(random.Random(f"{cfgRuns['seed']}:{level}").sample(combinations, cfgMatrix['samples']))
+        for combination in chosen:
+            result.append(':'.join([str(level)] + [f"{tag}{value}" for (tag, values), value in zip(dimensions, combination)]))
+    return result
+
+def split(key):
+    ''' Split level key into its level and dict of parameters by dimension name '''
+    level, *fields = str(key).split(':')
+    names = dict((tag, name) for name, tag in DIMENSIONS)
+    return level, {names[field[0]]: int(field[1:]) for field in fields}
+
+def wbits(params, fmt):
+    ''' Return windowBits argument selecting the stream format with the window size of params '''
+    bits = params.get('window_bits', DEFAULT_WINDOW_BITS)
+    if fmt == 'gzip':
+        return bits + 16
+    if fmt == 'raw':
+        return -bits
+    return bits
+
+def args(params, fmt, decompress=False):
+    ''' Return minideflate options for params, memLevel and windowBits only apply to compression '''
+    options = []
+    if 'window_bits' in params and not decompress:
+        options.append(f"-w {wbits(params, fmt)}")
+    if 'mem_level' in params and not decompress:
+        options.append(f"-m {params['mem_level']}")
+    if 'read_size' in params:
+        options.append(f"-r {params['read_size']}")
+    if 'write_size' in params:
+        options.append(f"-t {params['write_size']}")
+    return ' '.join(options)
+
+def memory(params):
+    ''' Return deflate memory use in bytes estimated by the zlib formula, (1 << (windowBits+2)) + (1 << (memLevel+9)) '''
+    return (1 << (params.get('window_bits', DEFAULT_WINDOW_BITS) + 2)) + (1 << (params.get('mem_level', DEFAULT_MEM_LEVEL) + 9))
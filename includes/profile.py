@@ -0,0 +1,95 @@
+""" profile.py -- Helperfunctions for profiling the testtool with perf record, and summarizing its hotspots.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import json
+import subprocess
+
+from includes import util
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig
+    cfgConfig = inConfig
+
+def record(command, datafile, env=None, output=os.devnull):
+    ''' Run command under perf record with call graphs, returns its parsed samples '''
+    util.runcommand(f"/usr/bin/perf record -q -g -F {cfgConfig['hotspots_freq']} -o {datafile} -- {command}", env=env, output=output)
+    try:
+        proc = subprocess.run(['/usr/bin/perf', 'script', '-i', datafile, '-F', 'comm,period,ip,sym,dso'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors='replace')
+    finally:
+        os.unlink(datafile)
+    if proc.returncode != 0:
+        sys.exit(f"Failed, perf script returned {proc.returncode} for '{datafile}'")
+    return parse_script(proc.stdout)
+
+def frame(line):
+    ''' Return symbol of a perf script callchain line, like "7f12ab longest_match+0x45 (/usr/lib/libz-ng.so)" '''
+    fields = line.split(None, 1)
+    if len(fields) < 2:
+        return '[unknown]'
+    symbol, dso = fields[1], ''
+    if symbol.endswith(')') and ' (' in symbol:
+        symbol, dso = symbol.rsplit(' (', 1)
+    symbol = symbol.split('+0x')[0].strip()
+    if symbol == '[unknown]' and dso:
+        return f"[{os.path.basename(dso[:-1])}]"
+    return symbol
+
+def parse_script(output):
+    ''' Parse perf script output into samples per symbol (self time) and per folded call stack '''
+    profile = {'samples': 0, 'self': dict(), 'folded': dict()}
+    for block in output.split('\n\n'):
+        lines = [line for line in block.split('\n') if line.strip()]
+        if not lines or lines[0][0].isspace():
+            continue
+        header = lines[0].split()
+        period = int(header[-1]) if len(header) > 1 and header[-1].isdigit() else 1
+        stack = [frame(line) for line in lines[1:]] or ['[unknown]']
+
+        profile['samples'] += period
+        profile['self'][stack[0]] = profile['self'].get(stack[0], 0) + period
+        folded = ';'.join([header[0]] + stack[::-1])
+        profile['folded'][folded] = profile['folded'].get(folded, 0) + period
+    return profile
+
+def percentages(profile):
+    ''' Return self time of each symbol in percent of all samples '''
+    total = profile['samples'] or 1
+    return {symbol: count*100/total for symbol, count in profile['self'].items()}
+
+def top(profile, count):
+    ''' Return the count symbols with the highest self time, as (symbol, percent) pairs '''
+    return sorted(percentages(profile).items(), key=lambda item: -item[1])[:count]
+
+def writefolded(profile, filename):
+    ''' Write folded stacks, as used by flamegraph.pl and similar tools '''
+    with open(filename, 'w') as f:
+        for stack, count in sorted(profile['folded'].items()):
+            f.write(f"{stack} {count}\n")
+
+def save(profiles, filename):
+    ''' Save self time per symbol of profiles[tool][level][phase], for diffing against later runs '''
+    summary = {tool: {level: {phase: {'samples': profile['samples'], 'self': profile['self']} for phase, profile in phases.items()}
+                      for level, phases in levels.items()}
+               for tool, levels in profiles.items()}
+    with open(filename, 'w') as f:
+        json.dump(summary, f, indent=1)
+
+def load(filename):
+    ''' Load hotspots saved by an earlier run, returns profiles of its first tool '''
+    try:
+        with open(filename) as f:
+            summary = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error, unable to load hotspots from '{filename}': {e}")
+        sys.exit(1)
+    tool = next(iter(summary))
+    return tool, summary[tool]
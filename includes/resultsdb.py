@@ -0,0 +1,167 @@
+""" resultsdb.py -- Persistent SQLite store of benchmark results, and regression detection between stored runs.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import json
+import sqlite3
+import statistics
+import time
+
+from includes import cli
+from includes import stats
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    baseline INTEGER NOT NULL DEFAULT 0,
+    git_rev TEXT,
+    tool TEXT,
+    tool_hash TEXT,
+    tool_size INTEGER,
+    staging TEXT,
+    sysinfo TEXT,
+    config TEXT,
+    comp TEXT,
+    decomp TEXT,
+    totals TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    level TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    compsize INTEGER,
+    comptime REAL,
+    decomptime REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id);
+'''
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig, dbfile
+    cfgConfig = inConfig
+    dbfile = os.path.expanduser(cfgConfig['results_db']) if cfgConfig['results_db'] else None
+
+def connect():
+    ''' Open results database, creating it if needed '''
+    os.makedirs(os.path.dirname(dbfile) or '.', exist_ok=True)
+    db = sqlite3.connect(dbfile)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    # Databases created before staging was recorded lack its column
+    if 'staging' not in [column['name'] for column in db.execute('PRAGMA table_info(runs)')]:
+        db.execute('ALTER TABLE runs ADD COLUMN staging TEXT')
+    return db
+
+def store(results, comp, decomp, totals, info):
+    ''' Store raw samples and aggregates of a benchmark, returns the run id '''
+    with connect() as db:
+        cursor = db.execute('INSERT INTO runs (timestamp, git_rev, tool, tool_hash, tool_size, staging, sysinfo, config, comp, decomp, totals) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (time.strftime('%Y-%m-%d %H:%M:%S'), info['git_rev'], info['tool'], info['tool_hash'], info['tool_size'],
+                             json.dumps(info['staging']), json.dumps(info['sysinfo']), json.dumps(info['config'], default=str),
+                             json.dumps(comp), json.dumps(decomp), json.dumps(totals)))
+        runid = cursor.lastrowid
+        for level, samples in results.items():
+            db.executemany('INSERT INTO samples (run_id, level, idx, compsize, comptime, decomptime, extra) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           [(runid, level, idx, sample[0], sample[1], sample[2], json.dumps(sample[3] if len(sample) > 3 else None))
+                            for idx, sample in enumerate(samples)])
+    return runid
+
+def mark_baseline(runid):
+    ''' Make runid the baseline that --compare-to baseline refers to '''
+    with connect() as db:
+        db.execute('UPDATE runs SET baseline = 0')
+        db.execute('UPDATE runs SET baseline = 1 WHERE id = ?', (runid,))
+
+def load(runref):
+    ''' Load stored run by id, or the current baseline. Returns run info and samples per level '''
+    with connect() as db:
+        if runref == 'baseline':
+            row = db.execute('SELECT * FROM runs WHERE baseline = 1 ORDER BY id DESC LIMIT 1').fetchone()
+        elif str(runref).isdigit():
+            row = db.execute('SELECT * FROM runs WHERE id = ?', (int(runref),)).fetchone()
+        else:
+            print(f"Error, invalid run reference '{runref}'. Use a run id or 'baseline'.")
+            sys.exit(1)
+        if row is None:
+            print(f"Error, run '{runref}' not found in {dbfile}")
+            sys.exit(1)
+
+        run = dict(row)
+        for key in ('staging', 'sysinfo', 'config', 'comp', 'decomp', 'totals'):
+            run[key] = json.loads(run[key]) if run[key] else None
+
+        samples = dict()
+        for sample in db.execute('SELECT * FROM samples WHERE run_id = ? ORDER BY level, idx', (run['id'],)):
+            extra = json.loads(sample['extra']) if sample['extra'] else None
+            samples.setdefault(sample['level'], []).append([sample['compsize'], sample['comptime'], sample['decomptime'], extra])
+    return run, samples
+
+def classify(old, new, confidence):
+    ''' Compare times against the measured noise, returns change in percent and a status string '''
+    if len(old) < 2 or len(new) < 2 or not statistics.mean(old):
+        return 0.0, 'n/a'
+    diff = statistics.mean(new) - statistics.mean(old)
+    noise = stats.welch_halfwidth(old, new, confidence)
+    pct = diff * 100 / statistics.mean(old)
+    if diff > noise:
+        return pct, f"{cli.RED}REGRESSION{cli.RESET}"
+    if diff < -noise:
+        return pct, f"{cli.GREEN}faster{cli.RESET}"
+    return pct, 'noise'
+
+def compare(runref, samples, info, levels, confidence, trim):
+    ''' Print per level comparison of current samples against a stored run, flagging changes beyond the noise '''
+    run, oldsamples = load(runref)
+    print(f"\nComparing against run {run['id']} from {run['timestamp']}, tool {run['tool']} rev {run['git_rev']}")
+    if run['tool_hash'] == info['tool_hash']:
+        print("Warning: testtool is identical to the stored run")
+    if run['staging'] is None:
+        print("Warning: staging of the stored run is unknown")
+    elif run['staging'] != info['staging']:
+        # Cold and warm cache numbers, or different memory placement, are not comparable
+        describe = lambda staging: ', '.join(f"{key} {value}" for key, value in staging.items())
+        print(f"Error, run {run['id']} was staged with {describe(run['staging'])}, this run with {describe(info['staging'])}. Not comparable.")
+        return 0
+
+    oldtestdata = run['config'].get('testdata', dict()) if run['config'] else dict()
+    # Runs that only measured decompression have no compression times to compare
+    decomponly = info['config']['Config'].get('decomp_only') or (run['config'] or dict()).get('Config', dict()).get('decomp_only')
+    print(f"\n {'Level':5} {'Comp old':>9} {'Comp new':>9} {'Change':>8} {'Status':10} {'Decomp old':>11} {'Decomp new':>11} {'Change':>8} {'Status':10}")
+    regressions = 0
+    for level in levels:
+        if level not in oldsamples:
+            print(f" {level:5} not present in run {run['id']}")
+            continue
+        if oldtestdata.get(level, {}).get('hash') not in (None, info['config']['testdata'][level]['hash']):
+            print(f" {level:5} testdata differs from run {run['id']}, not comparable")
+            continue
+
+        line = f" {level:5}"
+        for phase in (1, 2):
+            if phase == 1 and decomponly:
+                line += f" {'-':>9} {'-':>9} {'-':>8} {'n/a':10}"
+                continue
+            old = trim([sample[phase] for sample in oldsamples[level]])
+            new = trim([sample[phase] for sample in samples[level]])
+            pct, status = classify(old, new, confidence)
+            regressions += 'REGRESSION' in status
+            width = 9 if phase == 1 else 11
+            line += f" {statistics.mean(old):{width}.4f} {statistics.mean(new):{width}.4f} {pct:+7.2f}% {cli.padstr(status, 10, left=True)}"
+
+        if oldsamples[level][0][0] != samples[level][0][0]:
+            line += f" size {oldsamples[level][0][0]:,} -> {samples[level][0][0]:,}"
+        print(line)
+
+    if regressions:
+        print(f"\n{regressions} regression(s) exceed the measured noise at {confidence:.0%} confidence")
+    return regressions
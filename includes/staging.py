@@ -0,0 +1,114 @@
+""" staging.py -- Helperfunctions controlling where and how testdata pages live in memory.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import os, os.path
+import sys
+import ctypes
+import mmap
+import platform
+
+from includes import util
+
+# Filesystems keeping files in memory
+MEMORY_FS = ('tmpfs', 'ramfs', 'hugetlbfs')
+
+MODES = ('warm', 'willneed', 'populate', 'cold')
+
+# set_mempolicy is not wrapped by glibc, so it is called by syscall number
+SYS_SET_MEMPOLICY = {'x86_64': 238,
+                     'aarch64': 237,
+                     'ppc64le': 261,
+                     's390x': 270 }
+MPOL_BIND = 2
+
+def init(inConfig):
+    ''' Initialize variables '''
+    global cfgConfig
+    cfgConfig = inConfig
+
+def fstype(path):
+    ''' Return filesystem type of the mount containing path, using /proc/mounts '''
+    path = os.path.realpath(path)
+    best, besttype = '', None
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                mountpoint = fields[1].replace('\\040', ' ')
+                if len(mountpoint) >= len(best) and (path == mountpoint or path.startswith(mountpoint.rstrip('/') + '/')):
+                    best, besttype = mountpoint, fields[2]
+    except OSError:
+        pass
+    return besttype
+
+def checkfs():
+    ''' Warn, or fail if required, when temp_path is not memory backed. Cold staging needs a disk backed temp_path '''
+    fs = fstype(cfgConfig['temp_path'])
+    if cfgConfig['staging'] == 'cold' and fs in MEMORY_FS:
+        print(f"Error, cold staging can not evict files from {fs}, point temp_path at a disk backed filesystem.")
+        sys.exit(1)
+    if fs is None or fs in MEMORY_FS:
+        return fs
+    if cfgConfig['staging_require_tmpfs']:
+        print(f"Error, temp_path '{cfgConfig['temp_path']}' is on {fs}, not tmpfs/ramfs.")
+        sys.exit(1)
+    print(f"Warning: temp_path '{cfgConfig['temp_path']}' is on {fs}, not tmpfs/ramfs. Disk IO may affect results.")
+    return fs
+
+def nodecpus(node):
+    ''' Return list of cpus belonging to NUMA node '''
+    try:
+        with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+            return util.parse_cpulist(f.read().strip())
+    except OSError:
+        print(f"Error, NUMA node {node} does not exist.")
+        sys.exit(1)
+
+def bindnode(node):
+    ''' Bind memory allocations and cpus of this process and its children to a NUMA node '''
+    nr = SYS_SET_MEMPOLICY.get(platform.machine())
+    if nr is None:
+        print(f"Error, NUMA binding is not supported on {platform.machine()}.")
+        sys.exit(1)
+
+    cpus = nodecpus(node)
+    nodemask = ctypes.c_ulong(1 << node)
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(nr, MPOL_BIND, ctypes.byref(nodemask), ctypes.sizeof(nodemask)*8) != 0:
+        print(f"Error, set_mempolicy failed: {os.strerror(ctypes.get_errno())}")
+        sys.exit(1)
+    os.sched_setaffinity(0, cpus)
+    return cpus
+
+def prepare(filename):
+    ''' Put the pages of an input file in the state selected by the staging mode, before each measurement.
+        Used for testfiles before compression and compressed files before decompression '''
+    mode = cfgConfig['staging']
+    if mode == 'warm' or sys.platform == 'win32':
+        return
+
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        if mode == 'cold':
+            # Drop the file from the page cache, so every run reads it back in
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        elif os.fstat(fd).st_size:
+            flags = mmap.MAP_SHARED | (mmap.MAP_POPULATE if mode == 'populate' else 0)
+            with mmap.mmap(fd, 0, flags=flags, prot=mmap.PROT_READ) as mapped:
+                if mode == 'willneed':
+                    mapped.madvise(mmap.MADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+def describe():
+    ''' Return dict describing the staging of this benchmark, stored with its results '''
+    return {'mode': cfgConfig['staging'],
+            'fstype': fstype(cfgConfig['temp_path']),
+            'hugepages': cfgConfig['staging_hugepages'],
+            'numa_node': cfgConfig['numa_node']}
@@ -0,0 +1,114 @@
+""" stats.py -- Statistics helperfunctions.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import math
+import random
+import statistics
+
+def t_quantile(p, df):
+    ''' Quantile of Student's t distribution, using the Cornish-Fisher expansion around the normal quantile '''
+    # Closed forms exist for 1 and 2 degrees of freedom, where the expansion is inaccurate
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2*p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = statistics.NormalDist().inv_cdf(p)
+    if df == math.inf:
+        return z
+    g1 = (z**3 + z) / 4
+    g2 = (5*z**5 + 16*z**3 + 3*z) / 96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / 384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / 92160
+    return z + g1/df + g2/df**2 + g3/df**3 + g4/df**4
+
+def ci_halfwidth(samples, confidence=0.95):
+    ''' Half-width of the confidence interval of the mean '''
+    n = len(samples)
+    if n < 2:
+        return math.inf
+    return t_quantile(1 - (1 - confidence)/2, n - 1) * statistics.stdev(samples) / math.sqrt(n)
+
+def ci_relwidth(samples, confidence=0.95):
+    ''' Full width of the confidence interval of the mean, relative to the mean '''
+    halfwidth = ci_halfwidth(samples, confidence)
+    mean = statistics.mean(samples) if samples else 0
+    if halfwidth == 0:
+        return 0.0
+    if mean == 0:
+        return math.inf
+    return 2 * halfwidth / mean
+
+def mannwhitney(a, b):
+    ''' Two-sided p-value of the Mann-Whitney U test, using the normal approximation with tie correction '''
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+
+    # Rank the pooled samples, ties get their average rank
+    pooled = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(pooled)
+    tiesum = 0
+    i = 0
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        tiesum += (j - i + 1)**3 - (j - i + 1)
+        i = j + 1
+
+    r1 = sum(rank for rank, (value, group) in zip(ranks, pooled) if group == 0)
+    u = r1 - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tiesum / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / sigma
+    return min(1.0, 2 * (1 - statistics.NormalDist().cdf(max(z, 0))))
+
+def bootstrap_ratio(a, b, confidence=0.95, iterations=2000, seed=0):
+    ''' Bootstrap confidence interval of mean(a)/mean(b) '''
+    rng = random.Random(seed)
+    ratios = []
+    for i in range(iterations):
+        mean_b = statistics.fmean(rng.choices(b, k=len(b)))
+        if mean_b:
+            ratios.append(statistics.fmean(rng.choices(a, k=len(a))) / mean_b)
+    if not ratios:
+        return math.nan, math.nan
+    ratios.sort()
+    alpha = (1 - confidence) / 2
+    return ratios[int(alpha * (len(ratios) - 1))], ratios[int((1 - alpha) * (len(ratios) - 1))]
+
+def welch_halfwidth(a, b, confidence=0.95):
+    ''' Half-width of the confidence interval of mean(b) - mean(a), using Welch's t-test '''
+    var_a = statistics.variance(a) / len(a)
+    var_b = statistics.variance(b) / len(b)
+    if var_a + var_b == 0:
+        return 0.0
+    df = (var_a + var_b)**2 / (var_a**2 / (len(a) - 1) + var_b**2 / (len(b) - 1))
+    return t_quantile(1 - (1 - confidence)/2, max(1, round(df))) * math.sqrt(var_a + var_b)
+
+def correlation(x, y):
+    ''' Pearson correlation coefficient of x and y, 0 if either is constant '''
+    mean_x, mean_y = statistics.fmean(x), statistics.fmean(y)
+    sxy = sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y))
+    sxx = sum((a - mean_x)**2 for a in x)
+    syy = sum((b - mean_y)**2 for b in y)
+    if sxx == 0 or syy == 0:
+        return 0.0
+    return sxy / math.sqrt(sxx * syy)
+
+def correlation_critical(n, confidence=0.95):
+    ''' Smallest absolute correlation of n pairs that is significant at the given confidence '''
+    if n < 3:
+        return 1.0
+    t = t_quantile(1 - (1 - confidence)/2, n - 2)
+    return t / math.sqrt(n - 2 + t**2)
@@ -0,0 +1,237 @@
+""" synth.py -- Generators of synthetic testdata with controlled compressibility, using numpy.
+
+    Copyright (C) Hans Kristian Rosbach
+
+    This software is provided under the Zlib License.
+    See the included LICENSE file for details.
+"""
+
+import sys
+import zlib
+import hashlib
+
+MODELS = ('entropy', 'lz', 'markov', 'shuffle')
+
+# Settings each model's output depends on, besides the seed
+SETTINGS = {'entropy': ('entropy',),
+            'lz': ('entropy', 'literal_len', 'match_len', 'match_dist'),
+            'markov': (),
+            'shuffle': ('block_size',) }
+
+VERSION = 2                # bump when the output of a model changes, so cached testdata is regenerated
+CHUNK_SIZE = 16*1024*1024  # data is generated in independently seeded chunks of this size
+MARKOV_CHAINS = 65536      # markov chains generated side by side, each fills its own part of a chunk
+
+# Deflate length and distance codes, the lz model is decoded from a deflate stream
+LENGTH_BASE = (3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258)
+LENGTH_EXTRA = (0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0)
+DIST_BASE = (1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025, 1537,
+             2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577)
+DIST_EXTRA = (0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13)
+
+def init(inGen):
+    ''' Initialize variables '''
+    global cfgGen
+    cfgGen = inGen
+
+def settings():
+    ''' Return the settings the output of the configured model depends on, used as cache key '''
+    result = {'model': cfgGen['model'], 'seed': cfgGen['seed'], 'chunk_size': CHUNK_SIZE, 'version': VERSION}
+    if cfgGen['model'] == 'markov':
+        result['chains'] = MARKOV_CHAINS
+    for name in SETTINGS[cfgGen['model']]:
+        result[name] = cfgGen[name]
+    return result
+
+def numpy():
+    ''' Import numpy on first use, it is only needed for synthetic testdata '''
+    try:
+        import numpy
+    except ImportError:
+        print("Error, synthetic testdata requires numpy. Install it with: python3 -m pip install numpy")
+        sys.exit(1)
+    return numpy
+
+def literal_cdf(np, bits):
+    ''' Return cumulative distribution over byte values with the given entropy in bits, using p(i) ~ exp(-k*i) '''
+    values = np.arange(256)
+    def distribution(k):
+        p = np.exp(-k * values)
+        return p / p.sum()
+    def entropy(p):
+        p = p[p > 0]
+        return -(p * np.log2(p)).sum()
+
+    # Entropy falls as k grows, bisect k for the wanted entropy
+    lo, hi = 0.0, 64.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if entropy(distribution(mid)) > bits:
+            lo = mid
+        else:
+            hi = mid
+    cdf = np.cumsum(distribution(hi))
+    cdf[-1] = 1.0
+    return cdf
+
+def literal_table(np):
+    ''' Return a lookup table from random 16-bit values to literals with the configured entropy, computed once '''
+    global littable
+    if littable is None:
+        cdf = literal_cdf(np, cfgGen['entropy'])
+        littable = np.searchsorted(cdf, (np.arange(65536) + 0.5) / 65536, side='right').clip(0, 255).astype(np.uint8)
+    return littable
+
+littable = None
+
+def literals(np, rng, size):
+    ''' Draw size literals with the configured entropy '''
+    return literal_table(np)[rng.integers(0, 65536, size, dtype=np.uint16)]
+
+def geometric(rng, mean, size, minimum=1, maximum=None):
+    ''' Draw geometrically distributed integers with the given mean, clipped to [minimum, maximum] '''
+    values = rng.geometric(1 / max(mean - minimum + 1, 1), size) + minimum - 1
+    return values if maximum is None else values.clip(minimum, maximum)
+
+def gen_entropy(np, rng, size, source):
+    ''' Independent literals with the configured entropy per byte '''
+    return literals(np, rng, size)
+
+def fixed_code(symbol):
+    ''' Return the fixed huffman code of a deflate literal/length symbol, bit reversed, and its length '''
+    if symbol < 144:
+        code, bits = 0x30 + symbol, 8
+    elif symbol < 256:
+        code, bits = 0x190 + symbol - 144, 9
+    elif symbol < 280:
+        code, bits = symbol - 256, 7
+    else:
+        code, bits = 0xc0 + symbol - 280, 8
+    return int(format(code, f'0{bits}b')[::-1], 2), bits
+
+def match_tables(np):
+    ''' Return the fixed huffman codes and lengths in bits of every match length and distance, computed once '''
+    global matchtables
+    if matchtables is None:
+        lencodes, lenbits = np.zeros(259, dtype=np.uint64), np.zeros(259, dtype=np.uint64)
+        for index, (base, extra) in enumerate(zip(LENGTH_BASE, LENGTH_EXTRA)):
+            code, bits = fixed_code(257 + index)
+            lengths = np.arange(base, min(base + (1 << extra), 259))
+            lencodes[lengths] = code | (lengths - base).astype(np.uint64) << np.uint64(bits)
+            lenbits[lengths] = bits + extra
+        distcodes, distbits = np.zeros(32769, dtype=np.uint64), np.zeros(32769, dtype=np.uint64)
+        for index, (base, extra) in enumerate(zip(DIST_BASE, DIST_EXTRA)):
+            dists = np.arange(base, base + (1 << extra))
+            distcodes[dists] = int(format(index, '05b')[::-1], 2) | (dists - base).astype(np.uint64) << np.uint64(5)
+            distbits[dists] = 5 + extra
+        matchtables = lencodes, lenbits, distcodes, distbits
+    return matchtables
+
+matchtables = None
+
+def gen_lz(np, rng, size, source):
+    ''' Alternating literal runs and matches, with geometric run lengths, match lengths and distances.
+        The tokens are written as a deflate stream that zlib decodes, so matches are copied by inflate '''
+    # Draw enough tokens to fill the chunk, each token is a literal run followed by a match
+    count = int(size / (cfgGen['literal_len'] + cfgGen['match_len']) * 1.2) + 16
+    while True:
+        litlens = geometric(rng, cfgGen['literal_len'], count, 1, 65535)
+        matchlens = geometric(rng, cfgGen['match_len'], count, 3, 258)
+        dists = geometric(rng, cfgGen['match_dist'], count, 1, 32768)
+        ends = np.cumsum(litlens + matchlens)
+        if ends[-1] >= size:
+            break
+        count *= 2
+    count = int(np.searchsorted(ends, size)) + 1
+    litlens, matchlens, dists = litlens[:count], matchlens[:count], dists[:count]
+    dists = np.minimum(dists, ends[:count] - matchlens)
+
+    # Literal runs are stored blocks, each match is a fixed huffman block of its own. A match field holds the
+    # fixed block header, the match, end of block and the header of the next stored block, padded to a byte
+    lencodes, lenbits, distcodes, distbits = match_tables(np)
+    matchbits = lenbits[matchlens] + distbits[dists]
+    fields = np.uint64(2) | (lencodes[matchlens] | distcodes[dists] << lenbits[matchlens]) << np.uint64(3)
+    fields[-1] |= np.uint64(1) << (matchbits[-1] + np.uint64(10))  # the last stored block is final and empty
+    fieldlens = (matchbits.astype(np.int64) + 20) >> 3
+    tokenlens = 4 + litlens + fieldlens
+    tokenpos = np.cumsum(tokenlens) - tokenlens + 1
+    streamlen = 1 + int(tokenlens.sum()) + 4
+
+    # Fill the stream with literals, then write the match fields and the stored block lengths over it. Fields are
+    # written 8 bytes wide, the excess lands on the length of the next stored block, which is written after them
+    stream = literals(np, rng, streamlen)
+    stream[0] = 0
+    fieldpos = tokenpos + 4 + litlens
+    stream[fieldpos[:, None] + np.arange(8)] = fields.astype('<u8').view(np.uint8).reshape(count, 8)
+    storedlens = np.append(litlens, 0).astype('<u2')
+    headers = np.column_stack((storedlens, ~storedlens)).view(np.uint8)
+    stream[np.append(tokenpos, streamlen - 4)[:, None] + np.arange(4)] = headers
+    return np.frombuffer(zlib.decompressobj(-15).decompress(stream.tobytes()), dtype=np.uint8)[:size]
+
+def markov_model(np, source):
+    ''' Return a lookup table from state and random 16-bit value to the next state, using the order-1 byte
+        transitions of the source file, computed once '''
+    global markov
+    if markov is None:
+        data = np.frombuffer(source, dtype=np.uint8)
+        counts = np.bincount(data[:-1].astype(np.int64) * 256 + data[1:], minlength=256*256).reshape(256, 256).astype(np.float64)
+        # Bytes never followed by anything in the source continue uniformly
+        counts[counts.sum(axis=1) == 0] = 1
+        # Every state gets 65536 slots, divided among the next states by their probability
+        bounds = np.rint(np.cumsum(counts, axis=1) / counts.sum(axis=1, keepdims=True) * 65536).astype(np.int64)
+        widths = np.diff(bounds, axis=1, prepend=0)
+        markov = np.repeat(np.tile(np.arange(256, dtype=np.uint8), 256), widths.ravel())
+    return markov
+
+markov = None
+
+def gen_markov(np, rng, size, source):
+    ''' Order-1 Markov chain trained on the source file, many chains are stepped at once '''
+    table = markov_model(np, source)
+    chains = min(MARKOV_CHAINS, -(-size // 8))
+    steps = -(-size // (chains * 8)) * 8
+    randoms = rng.integers(0, 65536, (steps, chains), dtype=np.uint16)
+    state = np.frombuffer(source, dtype=np.uint8)[rng.integers(0, len(source), chains)].astype(np.int32)
+    # Collect 8 steps of every chain in a word, so laying out each chain contiguously transposes words, not bytes
+    group = np.empty((chains, 8), dtype=np.uint8)
+    words = np.empty((steps // 8, chains), dtype='<u8')
+    for step in range(steps):
+        state = table[(state << 16) | randoms[step]].astype(np.int32)
+        group[:, step % 8] = state
+        if step % 8 == 7:
+            words[step // 8] = group.view('<u8')[:, 0]
+    return words.T.copy().view(np.uint8).ravel()[:size]
+
+def gen_shuffle(np, rng, size, source):
+    ''' Blocks sampled from random offsets of the source file '''
+    blocksize = min(cfgGen['block_size'], len(source))
+    offsets = rng.integers(0, len(source) - blocksize + 1, -(-size // blocksize))
+    view = memoryview(source)
+    return np.frombuffer(b''.join(view[offset:offset+blocksize] for offset in offsets.tolist())[:size], dtype=np.uint8)
+
+GENERATORS = {'entropy': gen_entropy,
+              'lz': gen_lz,
+              'markov': gen_markov,
+              'shuffle': gen_shuffle }
+
+def generate(sourcefile, destfile, size):
+    ''' Write size MiB of data from the configured model to destfile. Returns hash and size.
+        Every chunk has its own seed, so the output only depends on settings() and the source file '''
+    np = numpy()
+    size = size*1024*1024
+    source = None
+    if cfgGen['model'] in ('markov', 'shuffle'):
+        with open(sourcefile, 'rb') as f:
+            source = f.read()
+        if len(source) < 2:
+            print(f"Error: Sourcefile '{sourcefile}' is too small for the {cfgGen['model']} model.")
+            sys.exit(1)
+
+    sha1 = hashlib.sha1()
+    with open(destfile, 'wb') as dst:
+        for index, offset in enumerate(range(0, size, CHUNK_SIZE)):
+            rng = np.random.default_rng([cfgGen['seed'], index])
+            data = GENERATORS[cfgGen['model']](np, rng, min(CHUNK_SIZE, size - offset), source)
+            sha1.update(data)
+            dst.write(data)
+    return sha1.hexdigest(), size
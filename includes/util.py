@@ -7,14 +7,26 @@
 """
 
 import os, os.path
+import glob
 import sys
+import errno
+import contextlib
 import hashlib
 import math
 import platform
+import re
 import subprocess
 import shlex
+import shutil
+import struct
+import threading
+import time
+import zlib
 
 BUF_SIZE = 1024*1024  # lets read stuff in 1MB chunks when hashing or copying
+GEN_MEMLIMIT = 256*1024*1024  # source files up to this size are kept in memory while generating testfiles
+
+tweaked = False  # system tweaks are active and need to be restored
 
 def init(inConfig, inTuning):
     ''' Initialize variables '''
@@ -29,14 +41,35 @@ def get_env(bench=False):
         env['LD_PRELOAD'] = '/usr/lib64/nosync/nosync.so'
     return env
 
+def sysinfo():
+    ''' Collect system information '''
+    uname = platform.uname()
+    return {'os': f"{uname.system} {uname.release} {uname.version} {uname.machine}",
+            'cpu': platform.processor(),
+            'python': platform.python_version()}
+
 def printsysinfo():
     ''' Print system information '''
-    uname = platform.uname()
-    print(f"OS: {uname.system} {uname.release} {uname.version} {uname.machine}")
-    print(f"CPU: {platform.processor()}")
+    info = sysinfo()
+    print(f"OS: {info['os']}")
+    print(f"CPU: {info['cpu']}")
+
+def gitrevision(path):
+    ''' Return git revision of the repository containing path, or None '''
+    try:
+        proc = subprocess.run(['git', '-C', path, 'describe', '--always', '--dirty', '--abbrev=40'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return proc.stdout.strip() if proc.returncode == 0 else None
 
 def cputweak(enable):
     ''' Disable turbo, disable idlestates, and set fixed cpu mhz. Requires sudo rights. '''
+    global tweaked
+    if not enable and not tweaked:
+        return
+    tweaked = enable
+
     # Turn off cpu turbo and power savings
     if enable:
         if cfgTuning['use_turboctl']:
@@ -46,28 +79,53 @@ def cputweak(enable):
             runcommand('sudo /usr/bin/cpupower idle-set -D 2', silent=1)
 
     # Turn cpu turbo and power savings back on
+    # Keep going if one fails, restoring as much as possible
     if not enable:
         if cfgTuning['use_turboctl']:
-            runcommand('sudo /usr/bin/turboctl on')
+            runcommand('sudo /usr/bin/turboctl on', stoponfail=0)
         if cfgTuning['use_cpupower']:
-            runcommand(f"sudo /usr/bin/cpupower frequency-set --min {cfgTuning['cpu_std_minspeed']*1000} --max {cfgTuning['cpu_std_maxspeed']*1000}")
-            runcommand('sudo /usr/bin/cpupower idle-set -E')
+            runcommand(f"sudo /usr/bin/cpupower frequency-set --min {cfgTuning['cpu_std_minspeed']*1000} --max {cfgTuning['cpu_std_maxspeed']*1000}", stoponfail=0)
+            runcommand('sudo /usr/bin/cpupower idle-set -E', stoponfail=0)
 
-def findfile(filename,fatal=True):
-    ''' Search for filename in CWD, homedir and deflatebench.py-dir '''
+def cpustate(cpus=None):
+    ''' Sample mean frequency in MHz of cpus, default those we may run on, and the hottest thermal zone in Celsius.
+        Values are None where sysfs does not provide them '''
+    if cpus is None:
+        cpus = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else [0]
+    freqs = []
+    for cpu in cpus:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq") as f:
+                freqs.append(int(f.read()) / 1000)
+        except (OSError, ValueError):
+            pass
+    temps = []
+    for zone in glob.glob('/sys/class/thermal/thermal_zone*/temp'):
+        try:
+            with open(zone) as f:
+                temps.append(int(f.read()) / 1000)
+        except (OSError, ValueError):
+            pass
+    return {'mhz': sum(freqs) / len(freqs) if freqs else None,
+            'temp': max(temps) if temps else None}
+
+def findfile(filename,fatal=True,allowdir=False):
+    ''' Search for filename in CWD, homedir and deflatebench.py-dir, also matching directories if allowdir is set '''
+    filename = os.path.expanduser(filename)
     tmpCwd = os.path.normpath(os.path.join( os.getcwd(), filename))
     tmpHome = os.path.normpath(os.path.join( os.path.expanduser("~"), filename))
     filepath = os.path.dirname(os.path.realpath(__file__))
     tmpScript = os.path.normpath(os.path.join(filepath, '../', filename))
-    if os.path.isfile(tmpCwd):
+    found = lambda path: os.path.isfile(path) or (allowdir and os.path.isdir(path))
+    if found(tmpCwd):
         return os.path.realpath(tmpCwd)
-    elif os.path.isfile(tmpHome):
+    elif found(tmpHome):
         return os.path.realpath(tmpHome)
-    elif os.path.isfile(tmpScript):
+    elif found(tmpScript):
         return os.path.realpath(tmpScript)
 
     if fatal:
-        print(f"Unable to find file: '{filename}'")
+        print(f"Unable to find {'file or directory' if allowdir else 'file'}: '{filename}'")
         sys.exit(1)
     return None
 
@@ -83,53 +141,309 @@ def hashfile(file):
             sha1.update(data)
     return sha1.hexdigest()
 
+def filechunks(file):
+    ''' Read file in chunks '''
+    with open(file, 'rb') as f:
+        while True:
+            data = f.read(BUF_SIZE)
+            if not data:
+                break
+            yield data
+
+def bufferchunks(buf):
+    ''' Split in-memory buffer into chunks without copying '''
+    view = memoryview(buf)
+    for pos in range(0, len(view), BUF_SIZE):
+        yield view[pos:pos+BUF_SIZE]
+
+def verifystream(chunks, wbits=31):
+    ''' Decompress gzip (wbits 16+), zlib (8-15) or raw deflate (negative) stream using zlib and check its trailer.
+        Returns hash and size of the decompressed data and an error message, or None if the stream is valid '''
+    sha1 = hashlib.sha1()
+    d = zlib.decompressobj(wbits)
+    check = zlib.crc32 if wbits > 15 else zlib.adler32
+    checksum, isize, tail, trailing = check(b''), 0, b'', 0
+
+    try:
+        for data in chunks:
+            if d.eof:
+                trailing += len(data)
+                continue
+            out = d.decompress(data)
+            sha1.update(out)
+            if wbits > 0:
+                checksum = check(out, checksum)
+            isize += len(out)
+            # Keep the last bytes of the stream, they contain the trailer
+            consumed = len(data) - len(d.unused_data)
+            tail = (tail + bytes(data[max(consumed-8, 0):consumed]))[-8:]
+            trailing += len(d.unused_data)
+    except zlib.error as e:
+        return sha1.hexdigest(), isize, f"corrupt stream: {e}"
+
+    if not d.eof:
+        return sha1.hexdigest(), isize, "truncated stream"
+    if trailing:
+        return sha1.hexdigest(), isize, f"{trailing} bytes of trailing data after end of stream"
+
+    if wbits > 15:
+        crc, size = struct.unpack('<II', tail)
+        if crc != checksum:
+            return sha1.hexdigest(), isize, f"gzip trailer CRC32 {crc:08x} != {checksum:08x}"
+        if size != isize & 0xffffffff:
+            return sha1.hexdigest(), isize, f"gzip trailer ISIZE {size} != {isize & 0xffffffff}"
+    elif wbits > 0:
+        adler, = struct.unpack('>I', tail[-4:])
+        if adler != checksum:
+            return sha1.hexdigest(), isize, f"zlib trailer ADLER32 {adler:08x} != {checksum:08x}"
+    return sha1.hexdigest(), isize, None
+
+def hashbuffer(buf):
+    ''' Calculate hash of in-memory buffer '''
+    return hashlib.sha1(buf).hexdigest()
+
+def copyfd(srcfd, dstfd, size, dstoffset=0):
+    ''' Copy size bytes from the start of srcfd to dstoffset in dstfd inside the kernel.
+        Returns False if the filesystems do not support it '''
+    copied = 0
+    try:
+        while copied < size:
+            # copy_file_range shares extents (reflink) on filesystems that support it, sendfile is the fallback
+            if hasattr(os, 'copy_file_range'):
+                ret = os.copy_file_range(srcfd, dstfd, size-copied, copied, dstoffset+copied)
+            else:
+                os.lseek(dstfd, dstoffset+copied, os.SEEK_SET)
+                ret = os.sendfile(dstfd, srcfd, copied, size-copied)
+            if ret == 0:
+                return False
+            copied += ret
+    except OSError as e:
+        if e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+            return False
+        raise
+    return True
+
+def repeatfile(sourcefile,destfile,count):
+    ''' Write sourcefile count times into destfile, hashing the result in the same pass. Returns hash and size '''
+    srcsize = os.path.getsize(sourcefile)
+    sha1 = hashlib.sha1()
+    fastcopy = True
+
+    # Keep reasonably small source files in memory, so they are only read once
+    chunks = list(filechunks(sourcefile)) if srcsize <= GEN_MEMLIMIT else None
+
+    with open(sourcefile, 'rb') as src, open(destfile, 'wb') as dst:
+        for rep in range(count):
+            offset = rep*srcsize
+            if fastcopy:
+                fastcopy = copyfd(src.fileno(), dst.fileno(), srcsize, offset)
+            if not fastcopy:
+                dst.seek(offset)
+
+            for data in chunks if chunks is not None else filechunks(sourcefile):
+                sha1.update(data)
+                if not fastcopy:
+                    dst.write(data)
+    return sha1.hexdigest(), srcsize*count
+
+def copyfile(sourcefile,destfile,srchash=None):
+    ''' Copy file, calculating its hash in the same pass unless it is already known. Returns hash and size '''
+    if srchash is None:
+        return repeatfile(sourcefile,destfile,1)
+
+    srcsize = os.path.getsize(sourcefile)
+    with open(sourcefile, 'rb') as src, open(destfile, 'wb') as dst:
+        if not copyfd(src.fileno(), dst.fileno(), srcsize):
+            src.seek(0)
+            dst.seek(0)
+            shutil.copyfileobj(src, dst, BUF_SIZE)
+    return srchash, srcsize
+
 def generate_testfile(sourcefile,destfile,minsize):
-    ''' Make tempfiles that are concatenated repeatedly until the file is big enough '''
+    ''' Make tempfiles that are concatenated repeatedly until the file is big enough. Returns hash and size '''
     srcsize = os.path.getsize(sourcefile)
     if srcsize == 0:
         print(f"Error: Sourcefile '{sourcefile}' is empty, cannot generate testfiles.")
         sys.exit(1)
 
     count = math.ceil((minsize*1024*1024)/srcsize)
-    dstsize = srcsize*count
-
-    dst = open(destfile, "wb")
-    with open(sourcefile, 'rb') as src:
-        while os.path.getsize(destfile) < dstsize:
-            data = src.read(BUF_SIZE)
-            if not data:
-                src.seek(0)
-                continue
-            dst.write(data)
-    dst.close()
+    return repeatfile(sourcefile,destfile,count)
 
 def parse_timefile(filen):
     ''' Parse output from perf or time '''
+    with open(filen) as f:
+        content = f.readlines()
     if cfgConfig['use_perf']:
-        with open(filen) as f:
-            content = f.readlines()
-        for line in content:
-            if line[-13:-1] == 'seconds user':
-                return float(line[:-13])
-        return 0.0
+        lines = [line for line in content if line.rstrip().endswith('seconds user')]
+        value = lines[0].rstrip()[:-12] if lines else ''
     else:
-        with open(filen) as f:
-            content = f.readlines()
-        return float(content[0])
+        value = content[0] if content else ''
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Error, unable to parse the user time from {'perf stat' if cfgConfig['use_perf'] else 'time'} output:")
+        print(''.join(content).rstrip())
+        sys.exit(1)
 
-def runcommand(command, env=None, stoponfail=1, silent=1, output=os.devnull):
-    ''' Run command, and handle special cases '''
+def parse_cpulist(cpulist):
+    ''' Parse cpu list string like "2,4-7" into list of cpu numbers '''
+    cpus = []
+    for part in str(cpulist).replace(' ', '').split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last)+1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def parse_perfstat(filen):
+    ''' Parse counter lines of perf stat --no-scale output into dict of event: value.
+        Multiplexed counters are scaled up by the share of time they were running, uncounted ones are None '''
+    counters = dict()
+    with open(filen) as f:
+        for line in f:
+            # Like "  1234567      cycles:u    # 3.0 GHz    (49.97%)", the time lines are left to parse_timefile
+            match = re.match(r'\s*(<not counted>|<not supported>|[\d.,]+)\s+(?:msec\s+)?(\S+)', line)
+            if not match or line.lstrip().startswith('#') or 'seconds' in line:
+                continue
+            value, event = match.groups()
+            if value.startswith('<'):
+                counters[event] = None
+                continue
+            running = re.search(r'\((\d+(?:\.\d+)?)%\)\s*$', line)
+            pct = float(running.group(1)) if running else 100.0
+            if pct <= 0:
+                counters[event] = None
+                continue
+            try:
+                value = float(value)
+            except ValueError:
+                print(f"Error, unable to parse perf stat counter: {line.strip()}")
+                sys.exit(1)
+            counters[event] = value * 100 / pct if pct < 100 else value
+    return counters
+
+def runcommand(command, env=None, stoponfail=1, silent=1, output=os.devnull, cpu=None, stream=None):
+    ''' Run command, and handle special cases. If stream is set, stdout is piped to it in chunks '''
     env = env if env else None
     args = shlex.split(command, posix=sys.platform != 'win32')
     sp_args = {}
     if sys.platform == 'win32':
         sp_args['creationflags'] = subprocess.HIGH_PRIORITY_CLASS
-    if silent == 1:
+    if stream is not None:
+        with childsetup(cpu):
+            proc = subprocess.Popen(args,env=env,stdout=subprocess.PIPE,**sp_args)
+        while True:
+            data = proc.stdout.read(BUF_SIZE)
+            if not data:
+                break
+            stream(data)
+        proc.stdout.close()
+        retval = proc.wait()
+    elif silent == 1:
         devnull = open(output, 'w')
-        retval = subprocess.call(args,env=env,stdout=devnull,**sp_args)
+        with childsetup(cpu):
+            proc = subprocess.Popen(args,env=env,stdout=devnull,**sp_args)
+        retval = proc.wait()
         devnull.close()
     else:
-        retval = subprocess.call(args,env=env,**sp_args)
+        with childsetup(cpu):
+            proc = subprocess.Popen(args,env=env,**sp_args)
+        retval = proc.wait()
     if (retval != 0) and (stoponfail != 0):
         sys.exit(f"Failed, retval({retval}): {command}")
     return retval
+
+def runmeasured(command, env=None, stoponfail=1, output=os.devnull, cpu=None, stream=None, realtime=False):
+    ''' Run command directly, without perf or time, and measure it using wait4.
+        Returns dict with user/sys/wall time in seconds, max RSS in KiB and page fault counts '''
+    env = env if env else None
+    args = shlex.split(command)
+
+    outfile = open(output, 'w') if stream is None else subprocess.PIPE
+    starttime = time.monotonic()
+    with childsetup(cpu, True, realtime):
+        proc = subprocess.Popen(args,env=env,stdout=outfile)
+    if stream is not None:
+        while True:
+            data = proc.stdout.read(BUF_SIZE)
+            if not data:
+                break
+            stream(data)
+        proc.stdout.close()
+    else:
+        outfile.close()
+
+    usage = reap(proc, command, stoponfail)
+    usage['wall'] = time.monotonic() - starttime
+    return usage
+
+@contextlib.contextmanager
+def childsetup(cpu=None, priority=False, realtime=False):
+    ''' Pin the calling thread to cpu and optionally raise its priority while starting a child, which inherits both.
+        Affinity and priority are per thread on Linux, so this is safe from worker threads unlike preexec_fn '''
+    tid = threading.get_native_id()
+    affinity = os.sched_getaffinity(tid) if cpu is not None else None
+    niceness = os.getpriority(os.PRIO_PROCESS, tid) if priority else None
+    policy = (os.sched_getscheduler(tid), os.sched_getparam(tid)) if priority and realtime else None
+    try:
+        if cpu is not None:
+            os.sched_setaffinity(tid, {cpu})
+        if priority:
+            # Same priority as chrt -f 99 or nice -n -20, silently skipped without permission like nice does
+            try:
+                if realtime:
+                    os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(99))
+                else:
+                    os.setpriority(os.PRIO_PROCESS, tid, -20)
+            except OSError:
+                pass
+        yield
+    finally:
+        if policy is not None:
+            os.sched_setscheduler(tid, *policy)
+        if niceness is not None:
+            os.setpriority(os.PRIO_PROCESS, tid, niceness)
+        if affinity is not None:
+            os.sched_setaffinity(tid, affinity)
+
+def checkcpus(cpulist, setting):
+    ''' Check that every cpu of cpulist is available to this process '''
+    unavailable = sorted(set(cpulist) - os.sched_getaffinity(0))
+    if unavailable:
+        print(f"Error, cpu(s) {','.join(map(str, unavailable))} of '{setting}' are not available, usable cpus are {','.join(map(str, sorted(os.sched_getaffinity(0))))}.")
+        sys.exit(1)
+
+def reap(proc, command, stoponfail=1):
+    ''' Wait for process using wait4, returns dict with user/sys time in seconds, max RSS in KiB and page fault counts '''
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = retval = os.waitstatus_to_exitcode(status)
+    if (retval != 0) and (stoponfail != 0):
+        sys.exit(f"Failed, retval({retval}): {command}")
+
+    return {'user': rusage.ru_utime,
+            'sys': rusage.ru_stime,
+            'maxrss': rusage.ru_maxrss,
+            'minflt': rusage.ru_minflt,
+            'majflt': rusage.ru_majflt}
+
+def runbarrier(commands, outputs, cpus, env=None, priority=False, realtime=False):
+    ''' Start commands pinned to one cpu each, held back by a barrier until all are ready, then release them at once.
+        Returns wall time from release until the last one exited, and the wait4 resource usage of each command '''
+    env = env if env else None
+    procs = []
+    for command, output, cpu in zip(commands, outputs, cpus):
+        # The shell blocks in read until the barrier is released, then execs the command in its place
+        args = ['/bin/sh', '-c', 'read _ && exec "$@"', 'sh'] + shlex.split(command)
+        with open(output, 'w') as outfile:
+            with childsetup(cpu, priority, realtime):
+                procs.append(subprocess.Popen(args,env=env,stdin=subprocess.PIPE,stdout=outfile))
+
+    starttime = time.monotonic()
+    for proc in procs:
+        proc.stdin.write(b'\n')
+        proc.stdin.close()
+    usages = [reap(proc, command) for proc, command in zip(procs, commands)]
+    return time.monotonic() - starttime, usages